@@ -1,38 +1,819 @@
-# backend/ai_validator.py
-# Modulo per la pipeline GraphRAG e interazione LLM
-
-# Questa è una placeholder per la futura logica AI.
-# Al momento, non conterrà implementazioni funzionali.
-
-class AIValidator:
-    def __init__(self, model_name=None):
-        self.model_name = model_name
-        print(f"AIValidator inizializzato (placeholder). Modello: {self.model_name}")
-
-    def validate_with_llm(self, structured_ifc_json):
-        """
-        Simula la validazione di dati IFC strutturati (JSON) con un LLM.
-        Args:
-            structured_ifc_json (dict): Dati estratti e strutturati da un IFC.
-        Returns:
-            dict: Risultato della validazione (simulato).
-        """
-        print(f"Ricevuto JSON strutturato per la validazione AI: {str(structured_ifc_json)[:200]}...")
-        # Logica futura: inviare a LLM, processare la risposta
-        return {
-            "status": "AI_VALIDATION_PENDING",
-            "message": "La validazione AI non è ancora implementata.",
-            "details": "Questo è un placeholder."
-        }
-
-if __name__ == '__main__':
-    validator = AIValidator(model_name="mock_model")
-    sample_json_data = {
-        "project_name": "Sample Project",
-        "entities": [
-            {"type": "IfcWall", "id": "wall_01", "issues": 0},
-            {"type": "IfcDoor", "id": "door_01", "issues": 1, "description": "Missing fire rating"}
-        ]
-    }
-    result = validator.validate_with_llm(sample_json_data)
-    print(f"Risultato validazione (simulata): {result}")
\ No newline at end of file
+# backend/ai_validator.py
+# Modulo per la pipeline GraphRAG e interazione LLM
+
+# Questa è una placeholder per la futura logica AI.
+# Al momento, non conterrà implementazioni funzionali.
+#
+# Il modulo è completamente annotato con tipi, così può essere AOT-compilato
+# con mypyc/Cython (attributi tipizzati, accessi specializzati) senza modifiche.
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+import types
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable
+
+# Logger di modulo con NullHandler: nessun costo di formattazione né lock su
+# stdout sul percorso caldo finché l'applicazione non abilita il livello DEBUG.
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# httpx is optional until a real LLM endpoint is configured; keep the module
+# importable (and the placeholder path working) without it.
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# google-crc32c usa l'istruzione hardware CRC32 (~0.3 ns/byte contro i ~3 di
+# SHA-256): più che sufficiente come chiave di una lookup table in-process.
+# Fallback su zlib.crc32 (stdlib, comunque C). SHA-256 resta riservato alle
+# chiavi persistenti cross-process (vedi embed_cache).
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+# orjson (C, SIMD) serializza i payload IFC 5-10x più velocemente dello
+# stdlib json; se manca si ricade sullo stdlib.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# numpy + sentence-transformers abilitano il livello semantico della cache;
+# senza di essi resta attivo solo il livello exact-match.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# pyarrow fornisce la rappresentazione Struct-of-Arrays delle entità: colonne
+# contigue invece di una lista di dict sparsi sull'heap Python.
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Kernel numerici (Numba/NumPy) per il pre-filtro colonnare; richiedono numpy.
+if np is not None:
+    import ai_validator_kernels
+    import embed_cache
+else:
+    ai_validator_kernels = None
+    embed_cache = None
+
+# Database della cache embedding persistente (in backend/cache/, come i
+# DataFrame cachati da app.py).
+EMBED_CACHE_DB = os.path.join(os.path.dirname(__file__), "cache", "embeddings.db")
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# faiss (opzionale, idealmente faiss-gpu) accelera la scansione di similarità
+# quando la cache semantica supera FAISS_MIN_ENTRIES: una search() è ~costante
+# fino a milioni di vettori, contro la scansione lineare NumPy.
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# pydantic fornisce lo schema per il guided-JSON decoding lato server (vLLM):
+# vincolando il token stream allo schema si eliminano output malformati e i
+# relativi retry di parsing.
+try:
+    from typing import Literal
+
+    from pydantic import BaseModel
+
+    class ValidationResult(BaseModel):
+        """Verdetto di validazione strutturato restituito dall'LLM."""
+        status: Literal["OK", "WARN", "FAIL"]
+        message: str
+        details: str
+
+except ImportError:
+    BaseModel = None
+    ValidationResult = None
+
+# Default requests-per-minute budget towards the LLM endpoint.
+DEFAULT_QPM = 600
+
+# Cache LLM: dimensione del livello exact-match e soglia/ampiezza del livello semantico.
+EXACT_CACHE_SIZE = 1024
+SEMANTIC_CACHE_SIZE = 5
+# Sotto questa soglia la scansione lineare int8 batte il round-trip verso
+# l'indice FAISS (su GPU dominerebbe la copia host-device).
+FAISS_MIN_ENTRIES = 10_000
+SEMANTIC_THRESHOLD = 0.95
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Numero massimo di entità coalizzate in una singola richiesta LLM batched.
+DEFAULT_MAX_BATCH = 32
+
+# Scheduler a priorità: priorità di default delle richieste (0 = critica) e
+# finestra di coalescing entro cui richieste adiacenti vengono accorpate in un
+# unico batch LLM.
+DEFAULT_PRIORITY = 5
+DEFAULT_COALESCE_MS = 20
+
+# Circuit breaker verso l'endpoint LLM: dopo BREAKER_FAIL_MAX errori
+# consecutivi il circuito si apre e per BREAKER_RESET_TIMEOUT secondi le
+# chiamate vengono cortocircuitate a un verdetto "unavailable", evitando che
+# migliaia di task async in retry aggravino un backend già degradato.
+BREAKER_FAIL_MAX = 5
+BREAKER_RESET_TIMEOUT = 30.0
+
+# Retry con backoff esponenziale jitterato (i retry sincronizzati di molti
+# task creerebbero un thundering herd sul backend).
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF_INITIAL = 0.25
+RETRY_BACKOFF_MAX = 4.0
+
+# Finestra scorrevole della "validation cache" sui GUID dei genitori: in IFC
+# molte entità riferiscono lo stesso elemento ospitante (es. porte/aperture
+# sulla stessa parete); una volta validato il genitore, i figli senza issues
+# ereditano il verdetto senza una nuova chiamata LLM.
+PARENT_CACHE_SIZE = 5
+
+# Sotto questa soglia di entità il pre-filtro Python compilato è più economico
+# della conversione in array colonnari per il kernel numerico.
+PREFILTER_KERNEL_MIN_ENTITIES = 64
+
+
+# Tipi di entità considerati banalmente validi quando issues == 0: per questi
+# il pre-filtro locale risolve il verdetto senza interpellare l'LLM.
+PREFILTER_TRIVIAL_TYPES = (
+    "IfcWall",
+    "IfcWallStandardCase",
+    "IfcSlab",
+    "IfcBeam",
+    "IfcColumn",
+)
+
+
+def _to_soa(entities: list[dict[str, Any]]) -> pa.Table:
+    """
+    Converte la lista AoS di dict entità in una pyarrow.Table colonnare
+    (Struct-of-Arrays): 'type' dictionary-encoded (codice int invece di una
+    str Python per riga), 'id'/'description' come stringhe, 'issues' int32.
+    Le scansioni successive diventano passate vettorizzate su memoria contigua.
+    """
+    return pa.table({
+        "type": pa.array([e.get("type") for e in entities]).dictionary_encode(),
+        "id": pa.array([e.get("id") for e in entities], type=pa.string()),
+        # Issues non-int contano come 1 (non risolvibili localmente), come nel
+        # percorso Python compilato che le inoltra all'LLM.
+        "issues": pa.array(
+            [e.get("issues", 0) if isinstance(e.get("issues", 0), int) else 1
+             for e in entities],
+            type=pa.int32(),
+        ),
+        "description": pa.array(
+            [e.get("description") for e in entities], type=pa.string()
+        ),
+    })
+
+
+def _compile_prefilter(
+    trivial_types: tuple[str, ...] = PREFILTER_TRIVIAL_TYPES,
+) -> Callable[[dict[str, Any]], tuple | None]:
+    """
+    Genera (via exec) una funzione specializzata di pre-validazione per lo
+    schema noto delle entità: codice lineare senza loop né lookup generici,
+    molto più veloce di un walker di dict generico sul percorso caldo.
+
+    Returns:
+        Callable[[dict], tuple | None]: ('OK', None) se l'entità è banalmente
+        valida, altrimenti None (da inoltrare all'LLM).
+    """
+    lines = [
+        "def _prefilter(e):",
+        "    t = e.get('type'); iss = e.get('issues', 0)",
+    ]
+    for entity_type in trivial_types:
+        lines.append(
+            f"    if t == {entity_type!r}: return ('OK', None) if iss == 0 else None"
+        )
+    lines.append("    return None")
+    namespace: dict[str, Any] = {}
+    exec("\n".join(lines), namespace)
+    return namespace["_prefilter"]
+
+
+def _json_dumps(obj: Any) -> bytes:
+    """Serializes to JSON bytes via orjson when available (stdlib fallback)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=str).encode("utf-8")
+
+
+def _json_dumps_canonical(obj: Any) -> bytes:
+    """Canonical (sorted-keys) JSON bytes, used for cache keys and embeddings."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, default=str).encode("utf-8")
+
+
+class AIValidator:
+    # Niente __dict__ per istanza: attributi in slot tipizzati (meno memoria,
+    # accesso più rapido, e layout compatibile con la compilazione AOT).
+    __slots__ = (
+        "model_name", "endpoint", "qpm", "coalesce_ms", "semantic_cache_size",
+        "_client", "_sem", "_exact_cache", "_parent_cache",
+        "_sem_vectors", "_sem_scales", "_sem_results", "_faiss_index",
+        "_embedder", "_embed_cache", "_prefilter",
+        "_breaker_failures", "_breaker_opened_at",
+        "_queue", "_dispatcher_task", "_seq",
+    )
+
+    # Risultato placeholder congelato e condiviso: il percorso senza endpoint
+    # non alloca un nuovo dict a ogni chiamata.
+    _PENDING = types.MappingProxyType({
+        "status": "AI_VALIDATION_PENDING",
+        "message": "La validazione AI non è ancora implementata.",
+        "details": "Questo è un placeholder.",
+    })
+
+    # Verdetto degradato restituito a circuito aperto (stessa forma del placeholder).
+    _UNAVAILABLE = types.MappingProxyType({
+        "status": "AI_VALIDATION_UNAVAILABLE",
+        "message": "LLM backend temporaneamente non disponibile (circuito aperto).",
+        "details": "Riprovare dopo la finestra di cool-down.",
+    })
+
+    def __init__(self, model_name: str | None = None, endpoint: str | None = None,
+                 qpm: int = DEFAULT_QPM, coalesce_ms: int = DEFAULT_COALESCE_MS,
+                 semantic_cache_size: int = SEMANTIC_CACHE_SIZE) -> None:
+        self.model_name = model_name
+        self.endpoint = endpoint  # URL dell'endpoint LLM (None = placeholder)
+        self.qpm = qpm
+        self.coalesce_ms = coalesce_ms
+        self.semantic_cache_size = semantic_cache_size
+        # Client HTTP e semaforo creati pigramente al primo uso async,
+        # così __init__ resta utilizzabile anche fuori da un event loop.
+        self._client: httpx.AsyncClient | None = None
+        self._client_loop: Any = None  # loop proprietario del client condiviso
+        self._sem: asyncio.Semaphore | None = None
+        # Cache a due livelli per le risposte LLM:
+        # 1) exact-match: (lunghezza, CRC32C) del JSON canonico -> risultato (LRU);
+        # 2) semantica: embedding del JSON canonico -> risultato, riusata se
+        #    la similarità coseno supera SEMANTIC_THRESHOLD (ultime m entry).
+        self._exact_cache: OrderedDict[tuple[int, int], dict[str, Any]] = OrderedDict()
+        # Finestra scorrevole (m più recenti) dei verdetti per GUID genitore.
+        self._parent_cache: OrderedDict[str, str] = OrderedDict()
+        # Livello semantico quantizzato int8: matrice contigua dei vettori
+        # (N, D), scala di de-quantizzazione per riga e risultati allineati.
+        # Un quarto della banda di memoria rispetto a float32 sulla scansione.
+        self._sem_vectors: np.ndarray | None = None  # int8, (N, D)
+        self._sem_scales: np.ndarray | None = None  # float32, (N,)
+        self._sem_results: list[dict[str, Any]] = []
+        # Indice FAISS (GPU se disponibile), costruito pigramente quando la
+        # cache semantica supera FAISS_MIN_ENTRIES.
+        self._faiss_index: Any = None
+        self._embedder = None  # modello di embedding, caricato pigramente
+        self._embed_cache = None  # cache embedding persistente, creata pigramente
+        # Pre-filtro specializzato compilato una volta sola per lo schema noto.
+        self._prefilter = _compile_prefilter()
+        if ai_validator_kernels is not None:
+            # Paga il costo di compilazione JIT in __init__, non alla prima chiamata.
+            ai_validator_kernels.warmup()
+        # Scheduler a priorità: coda, task dispatcher e contatore di sequenza
+        # (tie-breaker FIFO a parità di priorità), creati pigramente nel loop.
+        # Stato del circuit breaker (conteggio errori consecutivi e istante
+        # di apertura del circuito).
+        self._breaker_failures = 0
+        self._breaker_opened_at: float | None = None
+        self._queue: asyncio.PriorityQueue | None = None
+        self._dispatcher_task: asyncio.Task | None = None
+        self._seq = itertools.count()
+        log.debug("AIValidator inizializzato (placeholder). Modello: %s", self.model_name)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Lazily creates the shared AsyncClient (connection pool reused across calls)."""
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._client_loop is not loop:
+            # Il client appartiene a un event loop ormai chiuso (ogni chiamata
+            # al wrapper sync passa da un asyncio.run nuovo): riusare le sue
+            # connessioni keepalive fallirebbe con "Event loop is closed".
+            # Il vecchio loop non può più eseguire aclose(); si abbandona il
+            # client e si lascia chiudere i socket al garbage collector.
+            self._client = None
+        if self._client is None:
+            if httpx is None:
+                raise RuntimeError("httpx is required for LLM calls but is not installed.")
+            self._client_loop = loop
+            # Un solo client condiviso per tutte le chiamate: handshake TCP+TLS
+            # pagato una volta, richieste multiplexate su HTTP/2 e retry di
+            # trasporto per gli errori di connessione.
+            # limits e http2 vanno passati al transport: con un transport
+            # esplicito httpx ignora gli argomenti omonimi del client.
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60),
+                transport=httpx.AsyncHTTPTransport(
+                    retries=2,
+                    http2=True,
+                    limits=httpx.Limits(
+                        max_keepalive_connections=64,
+                        max_connections=256,
+                    ),
+                ),
+            )
+        return self._client
+
+    def _prefilter_entities(self, entities: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Restituisce le sole entità non risolte dal pre-filtro locale.
+
+        Per liste grandi usa il kernel numerico colonnare (Numba/NumPy): una
+        singola passata costruisce gli array SoA (codice tipo, issues) e il
+        kernel marca le entità banalmente valide; per liste piccole il loop
+        Python compilato evita il costo della conversione.
+        """
+        if (
+            ai_validator_kernels is not None
+            and len(entities) >= PREFILTER_KERNEL_MIN_ENTITIES
+        ):
+            if pa is not None:
+                # Percorso SoA: una conversione colonnare, poi solo passate
+                # vettorizzate (kernel + filter) senza iterare dict Python.
+                table = _to_soa(entities)
+                type_column = table.column("type").combine_chunks()
+                dictionary = type_column.dictionary.to_pylist()
+                # Entità senza 'type' (o con type None) producono indici null
+                # nel dictionary encoding: si mappano su un codice sentinella
+                # non banale (l'ultimo slot della LUT, sempre False) e la
+                # conversione a numpy deve poter copiare, perché con null la
+                # via zero-copy solleva ArrowInvalid.
+                type_indices = type_column.indices
+                if type_indices.null_count:
+                    type_indices = type_indices.fill_null(len(dictionary))
+                type_ids = type_indices.to_numpy(zero_copy_only=False).astype(np.int32)
+                trivial_lut = np.array(
+                    [t in PREFILTER_TRIVIAL_TYPES for t in dictionary] + [False],
+                    dtype=np.bool_,
+                )
+                issues = table.column("issues").to_numpy().astype(np.int32)
+                resolved = ai_validator_kernels.prefilter(type_ids, issues, trivial_lut)
+                # La maschera del kernel seleziona i dict originali: ricostruire
+                # le entità da table.to_pylist() perderebbe i campi fuori dallo
+                # schema SoA (es. parent_guid, usato subito dopo da
+                # _resolve_via_parent, e ogni attributo extra del chiamante).
+                return [e for e, ok in zip(entities, resolved) if not ok]
+
+            type_codes = {}
+            type_ids = np.empty(len(entities), dtype=np.int32)
+            issues = np.empty(len(entities), dtype=np.int32)
+            for i, entity in enumerate(entities):
+                entity_type = entity.get("type")
+                type_ids[i] = type_codes.setdefault(entity_type, len(type_codes))
+                raw_issues = entity.get("issues", 0)
+                # Non-int come 1: non banalmente valide, inoltrate all'LLM
+                # (stessa semantica del percorso Python compilato).
+                issues[i] = raw_issues if isinstance(raw_issues, int) else 1
+            trivial_lut = np.zeros(len(type_codes), dtype=np.bool_)
+            for entity_type, code in type_codes.items():
+                trivial_lut[code] = entity_type in PREFILTER_TRIVIAL_TYPES
+            resolved = ai_validator_kernels.prefilter(type_ids, issues, trivial_lut)
+            return [e for e, ok in zip(entities, resolved) if not ok]
+        return [e for e in entities if self._prefilter(e) is None]
+
+    def _resolve_via_parent(self, entities: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Risolve localmente le entità il cui genitore (parent_guid) è già stato
+        validato di recente: un figlio senza issues proprie eredita il verdetto
+        del genitore. Restituisce le sole entità ancora da validare.
+        """
+        if not self._parent_cache:
+            return entities
+        unresolved = []
+        for entity in entities:
+            parent_guid = entity.get("parent_guid") or entity.get("parent")
+            if (
+                parent_guid is not None
+                and self._parent_cache.get(parent_guid) == "OK"
+                and entity.get("issues", 0) == 0
+            ):
+                self._parent_cache.move_to_end(parent_guid)
+                continue
+            unresolved.append(entity)
+        return unresolved
+
+    def _record_parent_verdicts(
+        self, entities: list[dict[str, Any]], status: str
+    ) -> None:
+        """Registra il verdetto delle entità validate come potenziali genitori."""
+        for entity in entities:
+            guid = entity.get("id")
+            if guid is not None:
+                self._parent_cache[guid] = status
+                self._parent_cache.move_to_end(guid)
+        while len(self._parent_cache) > PARENT_CACHE_SIZE:
+            self._parent_cache.popitem(last=False)
+
+    @staticmethod
+    def _cache_key(structured_ifc_json: dict[str, Any]) -> tuple[int, int]:
+        """
+        Chiave di cache in-process: (lunghezza, CRC32C) del JSON canonico.
+        Comporre il CRC con la lunghezza rende le collisioni trascurabili per
+        milioni di chiavi, a una frazione del costo di SHA-256.
+        """
+        buf = _json_dumps_canonical(structured_ifc_json)
+        if google_crc32c is not None:
+            return (len(buf), google_crc32c.value(buf))
+        return (len(buf), zlib.crc32(buf))
+
+    def _embed(self, structured_ifc_json: dict[str, Any]) -> np.ndarray | None:
+        """
+        Returns the normalized embedding of the canonical JSON, or None when the
+        optional embedding dependencies are not available.
+        """
+        if np is None or SentenceTransformer is None:
+            return None
+        if self._embed_cache is None:
+            # Gli embedding sopravvivono ai riavvii del processo: su cache hit
+            # il testo non viene mai ri-embeddato (né ri-fatturato, per API a
+            # pagamento); i miss sono embeddati in un'unica chiamata batch.
+            self._embed_cache = embed_cache.EmbedCache(
+                EMBED_CACHE_DB,
+                "sentence-transformers",
+                EMBEDDING_MODEL,
+                self._encode_batch,
+            )
+        canonical = _json_dumps_canonical(structured_ifc_json).decode("utf-8")
+        vec = self._embed_cache.get_or_embed([canonical])[0]
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _encode_batch(self, texts: list[str]) -> list[np.ndarray]:
+        """Embedda una lista di testi con il modello locale (caricato pigramente)."""
+        if self._embedder is None:
+            self._embedder = SentenceTransformer(EMBEDDING_MODEL)
+        return self._embedder.encode(texts)
+
+    def _cache_lookup(
+        self, key: tuple[int, int], structured_ifc_json: dict[str, Any]
+    ) -> tuple[dict[str, Any] | None, np.ndarray | None]:
+        """
+        Two-tier cache lookup: exact match on the (length, CRC32C) key first,
+        then cosine similarity over the most recent embeddings. Returns
+        (result, embedding) where both can be None; the embedding is reused
+        on insert to avoid re-encoding.
+        """
+        cached = self._exact_cache.get(key)
+        if cached is not None:
+            self._exact_cache.move_to_end(key)
+            return cached, None
+
+        vec = self._embed(structured_ifc_json)
+        if vec is not None and self._sem_results:
+            if faiss is not None and len(self._sem_results) >= FAISS_MIN_ENTRIES:
+                hit = self._faiss_lookup(vec)
+                return hit, vec
+
+            query, query_scale = self._quantize(vec)
+            # Prodotto int8 x int8 accumulato in int32 (upcast esplicito: numpy
+            # non allarga da solo e int16 overflowerebbe), poi de-quantizzato
+            # con le scale per-riga: equivale al coseno sui float originali.
+            scores = (
+                self._sem_vectors.astype(np.int32) @ query.astype(np.int32)
+            ).astype(np.float32) * (self._sem_scales * query_scale)
+            best = int(scores.argmax())
+            if scores[best] > SEMANTIC_THRESHOLD:
+                return self._sem_results[best], vec
+        return None, vec
+
+    def _faiss_lookup(self, vec: np.ndarray) -> dict[str, Any] | None:
+        """
+        Scansione di similarità via FAISS (inner product == coseno, vettori
+        normalizzati), spostata su GPU quando faiss-gpu è installato. L'indice
+        è ricostruito/esteso pigramente dalla matrice quantizzata.
+        """
+        count = len(self._sem_results)
+        if self._faiss_index is None:
+            index = faiss.IndexFlatIP(int(self._sem_vectors.shape[1]))
+            if hasattr(faiss, "StandardGpuResources"):
+                try:
+                    index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
+                except Exception:
+                    pass  # niente GPU: l'indice CPU resta comunque valido
+            self._faiss_index = index
+        if self._faiss_index.ntotal < count:
+            # Aggiunge solo le righe nuove, de-quantizzate a float32.
+            new_rows = (
+                self._sem_vectors[self._faiss_index.ntotal:].astype(np.float32)
+                * self._sem_scales[self._faiss_index.ntotal:, np.newaxis]
+            )
+            self._faiss_index.add(np.ascontiguousarray(new_rows))
+        scores, indices = self._faiss_index.search(
+            np.ascontiguousarray(vec.reshape(1, -1), dtype=np.float32), 1
+        )
+        if scores[0, 0] > SEMANTIC_THRESHOLD:
+            return self._sem_results[int(indices[0, 0])]
+        return None
+
+    @staticmethod
+    def _quantize(vec: np.ndarray) -> tuple[np.ndarray, np.floating]:
+        """Quantizza un vettore float32 a int8 con scala condivisa per riga."""
+        scale = float(np.abs(vec).max()) / 127.0
+        if scale == 0.0:
+            scale = 1.0
+        return np.round(vec / scale).astype(np.int8), np.float32(scale)
+
+    def _cache_store(self, key: tuple[int, int], vec: np.ndarray | None, result: dict[str, Any]) -> None:
+        """Inserts a validation result into both cache tiers (bounded)."""
+        self._exact_cache[key] = result
+        self._exact_cache.move_to_end(key)
+        while len(self._exact_cache) > EXACT_CACHE_SIZE:
+            self._exact_cache.popitem(last=False)
+        if vec is not None:
+            quantized, scale = self._quantize(vec)
+            if self._sem_vectors is None:
+                self._sem_vectors = quantized[np.newaxis, :]
+                self._sem_scales = np.array([scale], dtype=np.float32)
+            else:
+                self._sem_vectors = np.vstack([self._sem_vectors, quantized])
+                self._sem_scales = np.append(self._sem_scales, scale)
+            self._sem_results.append(result)
+            if len(self._sem_results) > self.semantic_cache_size:
+                self._sem_vectors = self._sem_vectors[-self.semantic_cache_size:]
+                self._sem_scales = self._sem_scales[-self.semantic_cache_size:]
+                del self._sem_results[:-self.semantic_cache_size]
+                self._faiss_index = None  # le righe sono scalate: indice da ricostruire
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Lazily creates the rate-limiting semaphore (bound to the running loop)."""
+        if self._sem is None:
+            # qpm -> concurrent in-flight requests; at least 1
+            self._sem = asyncio.Semaphore(max(1, self.qpm // 60))
+        return self._sem
+
+    async def avalidate_with_llm(self, structured_ifc_json: dict[str, Any]) -> dict[str, Any]:
+        """
+        Versione asincrona di validate_with_llm: invia il JSON strutturato
+        all'endpoint LLM senza bloccare l'event loop, così molti frammenti IFC
+        possono essere validati concorrentemente.
+
+        Args:
+            structured_ifc_json (dict): Dati estratti e strutturati da un IFC.
+        Returns:
+            dict: Risultato della validazione.
+        """
+        if self.endpoint is None:
+            # Nessun endpoint configurato: risultato placeholder condiviso
+            # (immutabile, zero allocazioni per chiamata).
+            return self._PENDING
+
+        # Pre-filtro locale: le entità banalmente valide non vengono inviate.
+        entities = structured_ifc_json.get("entities")
+        if entities:
+            unresolved = self._prefilter_entities(entities)
+            # I figli di elementi validati di recente ereditano il verdetto.
+            unresolved = self._resolve_via_parent(unresolved)
+            if not unresolved:
+                return {
+                    "status": "OK",
+                    "message": "All entities passed local pre-validation.",
+                    "details": f"{len(entities)} entities resolved without an LLM call.",
+                }
+            if len(unresolved) < len(entities):
+                structured_ifc_json = dict(structured_ifc_json, entities=unresolved)
+
+        # Short-circuit su frammenti identici o quasi identici (molto comuni nei
+        # modelli BIM) prima di pagare la chiamata di rete.
+        key = self._cache_key(structured_ifc_json)
+        cached, vec = self._cache_lookup(key, structured_ifc_json)
+        if cached is not None:
+            return cached
+
+        result = (await self._post_batch([structured_ifc_json]))[0]
+
+        self._cache_store(key, vec, result)
+        if entities and isinstance(result.get("status"), str):
+            self._record_parent_verdicts(
+                structured_ifc_json.get("entities", ()), result["status"]
+            )
+        return result
+
+    async def _post_batch(self, payloads: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Sends one coalesced request for a group of payloads and returns the
+        per-payload list of verdicts. The server receives a single JSON body
+        with an 'entities_to_validate' array so the inference engine can batch
+        them in one forward pass instead of one request per entity.
+        """
+        if self._breaker_is_open():
+            # Circuito aperto: nessuna chiamata, verdetto degradato immediato.
+            return [dict(self._UNAVAILABLE) for _ in payloads]
+
+        body = {"model": self.model_name, "entities_to_validate": payloads}
+        if ValidationResult is not None:
+            # vLLM-compatible guided decoding: il server genera solo token che
+            # rispettano lo schema, quindi il parsing non può fallire.
+            body["guided_json"] = {
+                "type": "array",
+                "items": ValidationResult.model_json_schema(),
+            }
+
+        try:
+            verdicts = await self._do_llm_call(body)
+        except Exception as exc:
+            self._breaker_record_failure()
+            log.warning("LLM call failed (%s); returning degraded verdicts.", exc)
+            return [dict(self._UNAVAILABLE) for _ in payloads]
+        self._breaker_record_success()
+
+        if isinstance(verdicts, dict):
+            # Alcuni server impacchettano l'array sotto una chiave dedicata.
+            verdicts = verdicts.get("results", [verdicts])
+        if len(verdicts) != len(payloads):
+            raise ValueError(
+                f"LLM batch response mismatch: {len(verdicts)} verdicts for {len(payloads)} payloads"
+            )
+        if ValidationResult is not None:
+            # Convalida (e normalizza) ogni verdetto contro lo schema.
+            verdicts = [ValidationResult.model_validate(v).model_dump() for v in verdicts]
+        return verdicts
+
+    async def _do_llm_call(self, body: dict[str, Any]) -> Any:
+        """
+        Esegue la POST verso l'endpoint con retry esponenziale jitterato sugli
+        errori transitori (connessione, 429, 5xx).
+        """
+        last_exc: Exception | None = None
+        for attempt in range(RETRY_ATTEMPTS):
+            if attempt:
+                backoff = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_INITIAL * 2 ** attempt)
+                await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+            try:
+                async with self._get_semaphore():
+                    client = self._get_client()
+                    # content=... bypassa completamente l'encoder JSON dello stdlib.
+                    resp = await client.post(
+                        self.endpoint,
+                        content=_json_dumps(body),
+                        headers={"Content-Type": "application/json"},
+                    )
+                    resp.raise_for_status()
+                    return resp.json()
+            except httpx.HTTPError as exc:
+                last_exc = exc
+        raise last_exc
+
+    def _breaker_is_open(self) -> bool:
+        """True se il circuito è aperto e la finestra di cool-down non è scaduta."""
+        if self._breaker_opened_at is None:
+            return False
+        if time.monotonic() - self._breaker_opened_at >= BREAKER_RESET_TIMEOUT:
+            # Half-open: si lascia passare il prossimo tentativo.
+            self._breaker_opened_at = None
+            return False
+        return True
+
+    def _breaker_record_failure(self) -> None:
+        self._breaker_failures += 1
+        if self._breaker_failures >= BREAKER_FAIL_MAX:
+            self._breaker_opened_at = time.monotonic()
+            log.warning(
+                "LLM circuit breaker opened after %d consecutive failures.",
+                self._breaker_failures,
+            )
+
+    def _breaker_record_success(self) -> None:
+        self._breaker_failures = 0
+        self._breaker_opened_at = None
+
+    async def avalidate_batch(
+        self, payloads: list[dict[str, Any]], max_batch: int = DEFAULT_MAX_BATCH
+    ) -> list[dict[str, Any]]:
+        """
+        Valida una lista di payload coalizzandoli in richieste LLM batched
+        (al massimo max_batch entità per richiesta).
+
+        Args:
+            payloads (list[dict]): Lista di frammenti IFC strutturati.
+            max_batch (int): Dimensione massima di un batch.
+        Returns:
+            list[dict]: Un risultato di validazione per ogni payload, in ordine.
+        """
+        if self.endpoint is None:
+            return [await self.avalidate_with_llm(p) for p in payloads]
+
+        results = []
+        for start in range(0, len(payloads), max_batch):
+            results.extend(await self._post_batch(payloads[start:start + max_batch]))
+        return results
+
+    def validate_batch(
+        self, payloads: list[dict[str, Any]], max_batch: int = DEFAULT_MAX_BATCH
+    ) -> list[dict[str, Any]]:
+        """Wrapper sincrono di avalidate_batch."""
+        return asyncio.run(self.avalidate_batch(payloads, max_batch=max_batch))
+
+    async def submit(
+        self, structured_ifc_json: dict[str, Any], priority: int = DEFAULT_PRIORITY
+    ) -> asyncio.Future:
+        """
+        Accoda una richiesta di validazione allo scheduler a priorità e
+        restituisce un Future con il risultato.
+
+        Le richieste critiche (priority=0) scavalcano quelle di contorno; le
+        richieste adiacenti con la stessa priorità vengono coalizzate dal
+        dispatcher in un'unica chiamata LLM batched entro coalesce_ms.
+        """
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if self._dispatcher_task is None or self._dispatcher_task.done():
+            self._dispatcher_task = asyncio.ensure_future(self._dispatcher())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((priority, next(self._seq), structured_ifc_json, future))
+        return future
+
+    async def _dispatcher(self) -> None:
+        """
+        Drena la coda a priorità: riempie un batch di richieste a pari priorità
+        fino a DEFAULT_MAX_BATCH o alla scadenza della finestra di coalescing,
+        poi esegue una singola chiamata batched e risolve i Future.
+        """
+        while True:
+            priority, _, payload, future = await self._queue.get()
+            batch = [(payload, future)]
+            deadline = asyncio.get_running_loop().time() + self.coalesce_ms / 1000.0
+            while len(batch) < DEFAULT_MAX_BATCH:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item[0] != priority:
+                    # Priorità diversa: torna in coda, sarà servita dal prossimo batch.
+                    self._queue.put_nowait(item)
+                    break
+                batch.append((item[2], item[3]))
+
+            try:
+                results = await self.avalidate_batch([p for p, _ in batch])
+            except Exception as exc:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+            else:
+                for (_, fut), result in zip(batch, results):
+                    if not fut.done():
+                        fut.set_result(result)
+
+    async def avalidate_many(self, payloads: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Valida più payload concorrentemente in un unico event loop."""
+        return await asyncio.gather(*(self.avalidate_with_llm(p) for p in payloads))
+
+    async def aclose(self) -> None:
+        """Chiude dispatcher e client HTTP condiviso (da chiamare allo shutdown)."""
+        if self._dispatcher_task is not None:
+            self._dispatcher_task.cancel()
+            self._dispatcher_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._client_loop = None
+
+    def validate_with_llm(self, structured_ifc_json: dict[str, Any]) -> dict[str, Any]:
+        """
+        Simula la validazione di dati IFC strutturati (JSON) con un LLM.
+        Wrapper sincrono (retro-compatibile) attorno a avalidate_with_llm.
+        Args:
+            structured_ifc_json (dict): Dati estratti e strutturati da un IFC.
+        Returns:
+            dict: Risultato della validazione (simulato).
+        """
+        # Argomenti economici (conteggio, non il repr del payload): il costo di
+        # serializzazione non viene pagato quando il livello DEBUG è disattivo.
+        log.debug(
+            "Ricevuto JSON strutturato per la validazione AI: %d entità",
+            len(structured_ifc_json.get("entities", ())),
+        )
+        return asyncio.run(self.avalidate_with_llm(structured_ifc_json))
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    validator = AIValidator(model_name="mock_model")
+    sample_json_data = {
+        "project_name": "Sample Project",
+        "entities": [
+            {"type": "IfcWall", "id": "wall_01", "issues": 0},
+            {"type": "IfcDoor", "id": "door_01", "issues": 1, "description": "Missing fire rating"}
+        ]
+    }
+    result = validator.validate_with_llm(sample_json_data)
+    print(f"Risultato validazione (simulata): {result}")
@@ -0,0 +1,61 @@
+# backend/ai_validator_kernels.py
+# Kernel numerici (Numba) per la pre-validazione delle entità in AIValidator.
+#
+# Il loop per-entità in puro Python è dominato dall'overhead dell'interprete;
+# qui lo stesso controllo gira su array NumPy colonnari (Struct-of-Arrays) ed
+# è JIT-compilato e parallelizzato con Numba. Senza Numba installato si ricade
+# su una versione NumPy vettorizzata, comunque molto più veloce del loop Python.
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+
+    # boundscheck=False: gli indici vengono da prange/type_ids già validati a
+    # monte, quindi si evita il check dei bound per elemento nel loop caldo.
+    @njit(parallel=True, cache=True, boundscheck=False)
+    def prefilter(type_ids, issues, trivial_lut):
+        """
+        Marca come 'banalmente valida' ogni entità il cui tipo è nella lookup
+        table dei tipi triviali e che ha zero issues.
+
+        Args:
+            type_ids (np.ndarray[int32]): Codice numerico del tipo per entità.
+            issues (np.ndarray[int32]): Conteggio issues per entità.
+            trivial_lut (np.ndarray[bool]): LUT indicizzata per codice tipo.
+        Returns:
+            np.ndarray[bool]: True dove l'entità è risolta localmente.
+        """
+        out = np.empty(type_ids.size, dtype=np.bool_)
+        for i in prange(type_ids.size):
+            out[i] = trivial_lut[type_ids[i]] and issues[i] == 0
+        return out
+
+else:
+
+    def prefilter(type_ids, issues, trivial_lut):
+        """Fallback NumPy vettorizzato (stessa semantica del kernel Numba)."""
+        return trivial_lut[type_ids] & (issues == 0)
+
+
+def warmup():
+    """Paga il costo di compilazione JIT una volta sola, su input minimi."""
+    prefilter(
+        np.zeros(1, dtype=np.int32),
+        np.zeros(1, dtype=np.int32),
+        np.zeros(1, dtype=np.bool_),
+    )
+
+
+if __name__ == "__main__":
+    warmup()
+    type_ids = np.array([0, 0, 1, 1], dtype=np.int32)
+    issues = np.array([0, 2, 0, 0], dtype=np.int32)
+    trivial_lut = np.array([True, False], dtype=np.bool_)
+    print(f"Numba available: {NUMBA_AVAILABLE}")
+    print(f"Prefilter result: {prefilter(type_ids, issues, trivial_lut)}")
@@ -1,614 +1,1188 @@
-# backend/app.py
-# File principale dell'applicazione backend Flask per IFC Analyzer AI.
-
-import os
-import uuid # Added for unique file IDs
-import threading # Added for asynchronous processing
-from flask import Flask, request, jsonify, send_from_directory, current_app # Added current_app
-from werkzeug.utils import secure_filename
-import pandas as pd
-from concurrent.futures import ThreadPoolExecutor
-import time # For creating unique file IDs if needed, and for thread pool operations
-import networkx as nx # Added for graph generation
-import matplotlib.pyplot as plt # Added for graph visualization
-
-# Importa i moduli locali che abbiamo creato
-import ifc_parser 
-import data_visualizer # Importiamo il modulo per i grafici
-
-# --- Configurazione Iniziale ---
-
-# Crea l'istanza dell'applicazione Flask
-# Configure static_folder to point to frontend/static for serving CSS, JS directly
-# os.path.dirname(__file__) is the 'backend' directory
-frontend_static_dir = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'static')
-app = Flask(__name__, static_folder=frontend_static_dir)
-
-# Configura una cartella per salvare i file IFC caricati
-UPLOAD_FOLDER = 'uploads' # Idealmente, questa dovrebbe essere in una sottocartella di 'backend'
-# Se app.py è in backend/, UPLOAD_FOLDER sarà backend/uploads/
-# Se app.py è nella root, UPLOAD_FOLDER sarà uploads/
-# Per coerenza con la struttura, assumiamo che app.py sia in backend/
-# e UPLOAD_FOLDER sia una sottocartella di backend/
-if not os.path.isabs(UPLOAD_FOLDER): # Se non è un percorso assoluto
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), UPLOAD_FOLDER)
-
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-# Configura una cartella per cachare i DataFrame processati
-CACHE_FOLDER = 'cache' # Sarà backend/cache/
-if not os.path.isabs(CACHE_FOLDER):
-    CACHE_FOLDER = os.path.join(os.path.dirname(__file__), CACHE_FOLDER)
-if not os.path.exists(CACHE_FOLDER):
-    os.makedirs(CACHE_FOLDER)
-app.config['CACHE_FOLDER'] = CACHE_FOLDER
-
-# Definisci le estensioni di file permesse (solo .ifc)
-ALLOWED_EXTENSIONS = {'ifc'}
-
-def allowed_file(filename):
-    """Verifica se l'estensione del file è permessa."""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-# Configura una cartella per i file statici (es. grafici generati)
-STATIC_FOLDER = 'static' # Sarà backend/static/
-if not os.path.isabs(STATIC_FOLDER):
-    STATIC_FOLDER = os.path.join(os.path.dirname(__file__), STATIC_FOLDER)
-
-PLOTS_SUBDIR = 'plots' # Sottocartella per i grafici
-PLOTS_FOLDER = os.path.join(STATIC_FOLDER, PLOTS_SUBDIR) # Sarà backend/static/plots/
-if not os.path.exists(PLOTS_FOLDER):
-    os.makedirs(PLOTS_FOLDER)
-
-GRAPHS_SUBDIR = 'graphs' # Sottocartella per i grafici di conoscenza
-GRAPHS_FOLDER = os.path.join(STATIC_FOLDER, GRAPHS_SUBDIR) # Sarà backend/static/graphs/
-if not os.path.exists(GRAPHS_FOLDER):
-    os.makedirs(GRAPHS_FOLDER)
-
-# Flask serve automaticamente i file dalla cartella 'static' se è al livello root dell'app.
-# Se 'static' è dentro 'backend', potremmo dover configurare diversamente o servire manualmente.
-# Per semplicità, Flask cerca 'static' relativo a dove l'app è inizializzata.
-# Se app è in backend/, Flask cercherà backend/static.
-
-# Struttura dati temporanea per tenere traccia dei file caricati e dei loro metadati
-# In un'applicazione reale, useresti un database.
-# La chiave sarà un ID univoco generato, il valore un dizionario con i dettagli.
-uploaded_files_metadata = {} 
-
-# Dictionary to store the status of parsing tasks
-# Key: file_id, Value: {status: 'pending'/'processing'/'completed'/'failed', original_filename: '...', result: {'csv_path': ..., 'json_path': ...} or None, error: str or None}
-parsing_status = {}
-
-# Helper function to process a single file (load from cache or parse IFC)
-# This will be run in a separate thread for each file.
-def process_single_ifc_file(file_id, file_info, app_config):
-    filepath = file_info.get("saved_path")
-    filename = file_info.get("original_filename", "Unknown File") # Use original_filename for consistency
-    df_properties = None
-    cached_df_path = file_info.get("cached_df_path")
-
-    if cached_df_path and os.path.exists(cached_df_path):
-        try:
-            df_properties = pd.read_pickle(cached_df_path)
-            file_info["processed_data_df"] = df_properties
-            print(f"Successfully loaded DataFrame from disk cache for file ID: {file_id}. Rows: {len(df_properties)}")
-            return file_id, filename, df_properties
-        except Exception as e:
-            print(f"Error loading DataFrame from disk cache {cached_df_path} for file ID {file_id}: {e}. Will try other methods.")
-            df_properties = None
-
-    if df_properties is None:
-        df_properties = file_info.get("processed_data_df")
-        if df_properties is not None:
-            print(f"Using existing in-memory DataFrame for file ID: {file_id}. Rows: {len(df_properties) if not df_properties.empty else 0}")
-            return file_id, filename, df_properties
-
-    if df_properties is None:
-        print(f"DataFrame for file ID {file_id} not found in disk or memory cache. Loading from IFC...")
-        if filepath and os.path.exists(filepath):
-            try:
-                # Corrected: extract_properties_from_ifc returns only the DataFrame
-                parsed_df = ifc_parser.extract_properties_from_ifc(filepath)
-                print(f"[Debug] For file ID {file_id}, parsed_df type: {type(parsed_df)}, Shape: {parsed_df.shape if hasattr(parsed_df, 'shape') else 'N/A'}")
-                if parsed_df is not None:
-                    df_properties = parsed_df
-                    file_info["processed_data_df"] = df_properties
-                    print(f"Successfully parsed IFC; loaded properties for file ID: {file_id}. Rows: {len(df_properties) if not df_properties.empty else 0}")
-                    if not df_properties.empty:
-                        new_cache_filename = f"{file_id.replace('-', '_')}_df.pkl" # Ensure filename is valid
-                        new_cache_filepath = os.path.join(app_config['CACHE_FOLDER'], new_cache_filename)
-                        try:
-                            df_properties.to_pickle(new_cache_filepath)
-                            file_info["cached_df_path"] = new_cache_filepath
-                            print(f"Successfully cached newly parsed DataFrame to disk: {new_cache_filepath}")
-                        except Exception as pickle_save_e:
-                            print(f"Error saving newly parsed DataFrame to pickle cache for {file_id}: {pickle_save_e}")
-                    else:
-                        print(f"Parsed IFC for {file_id}, but it resulted in an empty DataFrame. Not caching to disk.")
-                else:
-                    print(f"Parsing IFC for {file_id} did not return a DataFrame (returned None).")
-                    df_properties = pd.DataFrame() # Assign empty DataFrame to avoid errors later
-            except Exception as parse_e:
-                print(f"Error parsing IFC file {filepath} for file ID {file_id}: {parse_e}")
-                current_app.logger.error(f"Exception during IFC parsing for {file_id} ({filepath}): {parse_e}", exc_info=True)
-                df_properties = pd.DataFrame() # Assign empty DataFrame
-        else:
-            print(f"Original IFC file path not found for {file_id}: {filepath}")
-            df_properties = pd.DataFrame() # Assign empty DataFrame
-    
-    return file_id, filename, df_properties
-
-
-# --- Endpoint API ---
-
-@app.route('/api/upload', methods=['POST'])
-def upload_ifc_files():
-    """
-    Endpoint per caricare uno o più file IFC.
-    Salva i file nella UPLOAD_FOLDER e estrae i metadati iniziali.
-    """
-    if 'ifcFiles' not in request.files:
-        # Use English for API error responses
-        return jsonify({"error": "No 'ifcFiles' part in the request"}), 400
-
-    files = request.files.getlist('ifcFiles') # Gestisce caricamenti multipli
-    
-    uploaded_file_info = [] # Lista per restituire info sui file caricati con successo
-
-    for file in files:
-        if file.filename == '':
-            # Salta i file senza nome (potrebbe accadere se il campo è vuoto)
-            continue 
-            
-        if file and allowed_file(file.filename):
-            # Rendi sicuro il nome del file per evitare problemi di sicurezza/percorso
-            filename = secure_filename(file.filename)
-            
-            # Crea un percorso completo per salvare il file
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-            try:
-                # Salva il file sul server
-                file.save(filepath)
-                # Use English for server logs
-                print(f"File saved: {filepath}")
-
-                # Estrai i metadati usando la funzione dal nostro parser
-                # ifc_parser è nella stessa cartella backend/
-                # Estrai solo i metadati base usando la funzione dal nostro parser
-                # ifc_parser è nella stessa cartella backend/
-                fname, schema, software = ifc_parser.extract_ifc_metadata(filepath)
-
-                if fname: # Se l'estrazione dei metadati base ha successo
-                    file_id = str(uuid.uuid4()) # Genera un ID univoco
-                    
-                    # Store initial metadata and set parsing status to "pending"
-                    parsing_status[file_id] = {
-                        "status": "pending",
-                        "original_filename": filename,
-                        "schema": schema,
-                        "software": software,
-                        "saved_path": filepath, # Store path for the thread
-                        "result": None,
-                        "error": None
-                    }
-
-                    # Store basic info in uploaded_files_metadata as well, if needed for other parts of the app
-                    # This part might be refactored later if all info moves to parsing_status
-                    uploaded_files_metadata[file_id] = {
-                        "original_filename": filename,
-                        "saved_path": filepath,
-                        "schema": schema,
-                        "software": software,
-                        "discipline": None, # Potrebbe essere popolato in seguito
-                        "processed_data_df": None, # Questo è per la query ITO, non per il parsing iniziale
-                        "cached_df_path": None
-                    }
-
-                    # Start a new thread for parsing this file
-                    # The target function will update parsing_status
-                    thread = threading.Thread(target=parse_ifc_file_async, args=(file_id, filepath, app.config['CACHE_FOLDER']))
-                    thread.start()
-
-                    # Add info to return to the frontend (ID and basic info for status polling)
-                    uploaded_file_info.append({
-                        "id": file_id,
-                        "filename": filename,
-                        "schema": schema,
-                        "software": software,
-                        "status": "processing" # Inform frontend that processing has started
-                    })
-                    print(f"File {filename} (ID: {file_id}) received. Asynchronous parsing started.")
-                else:
-                    # Se l'estrazione dei metadati base fallisce
-                    print(f"Core metadata (fname, schema, software) not extracted for {filename}, file was saved but not processed further.")
-                    # Considera se eliminare il file o gestirlo diversamente
-
-            except Exception as e:
-                 # Use English for server error logs
-                print(f"Error during saving or metadata analysis for {filename}: {e}")
-                # Potresti voler restituire un errore specifico per questo file
-                
-        elif file and not allowed_file(file.filename):
-             # Use English for server warnings/logs
-             print(f"File not allowed: {file.filename}")
-             # Potresti voler informare l'utente specificamente per questo file
-
-    if not uploaded_file_info:
-         # Use English for API error responses
-         return jsonify({"error": "No valid IFC files uploaded or processed"}), 400
-
-    # Restituisce l'elenco dei file caricati con successo e i loro metadati base.
-    # Il messaggio ora riflette che il caricamento è veloce e il processamento completo è differito.
-    if not uploaded_file_info:
-        message = "No valid IFC files were processed or initiated for parsing."
-        return jsonify({"message": message, "files": []}), 400 # Bad request if no files are good
-    
-    message = f"{len(uploaded_file_info)} IFC file(s) received. Processing started in background."
-    return jsonify({"message": message, 
-                    "files": uploaded_file_info}), 202 # 202 Accepted, processing not complete
-
-
-# @app.route('/api/run_ito_query', methods=['POST'])
-# def run_ito_query():
-#     """
-#     Endpoint per eseguire una query ITO sui file selezionati.
-#     Estrae proprietà, filtra per tipo entità (query) e genera un grafico per ogni file.
-#     """
-#     try:
-#         data = request.get_json()
-#         if not data:
-#             return jsonify({"error": "Request body must be JSON"}), 400
-
-#         query_string = data.get('query') # Es. "IfcWall", "IfcDoor" (può essere None o vuoto)
-#         file_ids = data.get('file_ids') # Lista di ID dei file selezionati dal frontend
-
-#         if not file_ids or not isinstance(file_ids, list):
-#             return jsonify({"error": "Missing or invalid 'file_ids' list in request body"}), 400
-
-#         print(f"Received ITO query: '{query_string}' for file IDs: {file_ids}")
-
-#         all_data_frames = []
-#         charts_data = [] # New list to store individual chart data
-#         futures = []
-
-#         # Use a ThreadPoolExecutor to process files concurrently
-#         # The number of max_workers can be adjusted based on typical number of files and server resources
-#         with ThreadPoolExecutor(max_workers=min(5, len(file_ids) if file_ids else 1)) as executor:
-#             for file_id in file_ids:
-#                 if file_id in uploaded_files_metadata:
-#                     file_info = uploaded_files_metadata[file_id]
-#                     # Pass app.config to the helper function for CACHE_FOLDER access
-#                     futures.append(executor.submit(process_single_ifc_file, file_id, file_info, app.config))
-#                 else:
-#                     print(f"File ID {file_id} not found in uploaded_files_metadata. Skipping.")
-
-#             for future in futures:
-#                 try:
-#                     processed_file_id, processed_filename, df_properties = future.result() # Timeout can be added here
-#                     if df_properties is not None and not df_properties.empty:
-#                         df_properties_copy = df_properties.copy()
-#                         df_properties_copy['Source Model'] = processed_filename
-#                         all_data_frames.append(df_properties_copy)
-
-#                         # Generate chart for this specific file's data
-#                         df_for_chart = df_properties.copy() # Start with a copy to ensure original df_properties is not altered
-#                         # query_string is no longer used for initial chart filtering here
-#                         # The chart will always be based on the full data for the file initially
-                        
-#                         if not df_for_chart.empty:
-#                             _, chart_image_base64 = data_visualizer.plot_entity_counts(df_for_chart)
-#                             if chart_image_base64:
-#                                 charts_data.append({
-#                                     "file_id": processed_file_id,
-#                                     "filename": processed_filename,
-#                                     "chart_base64": chart_image_base64,
-#                                     "query_used_for_chart": "All Entities" # Always all entities for initial chart
-#                                 })
-#                             else:
-#                                 print(f"Chart generation failed for {processed_filename} using query 'All Entities'")
-#                         else:
-#                             print(f"No data to generate chart for {processed_filename} (displaying all entities)")
-#                     else:
-#                         print(f"No properties DataFrame available or it's empty for file ID: {processed_file_id}. Skipping for table and chart.")
-#                 except Exception as e:
-#                     # Log the exception from the thread
-#                     current_app.logger.error(f"Error processing a file in thread: {e}", exc_info=True)
-#                     # Optionally, you could add a placeholder or error message for this file in the response
-
-#         if not all_data_frames:
-#             print("No dataframes were processed or all were empty after concurrent processing.")
-#             return jsonify({
-#                 "message": "No data found for the selected files or query after processing.", 
-#                 "data": [], 
-#                 "charts_data": []
-#             }), 200
-
-#         # Combina tutti i DataFrame in uno solo per la tabella dei risultati
-#         df_combined = pd.concat(all_data_frames, ignore_index=True) if all_data_frames else pd.DataFrame()
-
-#         # The initial query_string is no longer used for server-side table filtering.
-#         # All data is returned, and filtering is handled by the client-side "Filter Results" section.
-#         df_filtered_table = df_combined
-
-#         # Converti il DataFrame filtrato in JSON per la risposta
-#         # Sostituisci NaN con None (che diventa null in JSON) per una migliore compatibilità
-#         data_for_frontend = df_filtered_table.fillna(value=pd.NA).to_dict(orient='records')
-#         # Sostituisci pd.NA con None per la serializzazione JSON
-#         data_for_frontend = [{k: (None if pd.isna(v) else v) for k, v in record.items()} for record in data_for_frontend]
-
-
-#         message = f"Query processed for {len(file_ids)} file(s). All data returned for client-side filtering."
-        
-#         print(f"Returning {len(data_for_frontend)} records and {len(charts_data)} charts.")
-
-#         return jsonify({
-#             "message": message,
-#             "data": data_for_frontend,
-#             "charts_data": charts_data # Pass the list of chart data objects
-#         }), 200
-
-#     except Exception as e:
-#         current_app.logger.error(f"Error during ITO query: {e}", exc_info=True)
-#         # Use English for API error responses
-#         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
-
-
-@app.route('/api/extract_data', methods=['POST'])
-def extract_data():
-    """Extracts data from selected processed IFC files and returns tabular results."""
-    try:
-        data = request.get_json()
-        if not data or 'file_ids' not in data or not isinstance(data['file_ids'], list):
-            return jsonify({"error": "Missing or invalid 'file_ids' list in request body"}), 400
-
-        file_ids = data['file_ids']
-        if not file_ids:
-            return jsonify({"error": "'file_ids' list cannot be empty"}), 400
-
-        all_data_frames = []
-        processed_count = 0
-
-        with ThreadPoolExecutor(max_workers=min(5, len(file_ids))) as executor:
-            futures = []
-            for file_id in file_ids:
-                if file_id in parsing_status and parsing_status[file_id]['status'] == 'completed':
-                    if file_id in uploaded_files_metadata:
-                        file_info = uploaded_files_metadata[file_id]
-                        futures.append(executor.submit(process_single_ifc_file, file_id, file_info, app.config))
-                    else:
-                        print(f"File ID {file_id} not found in uploaded_files_metadata. Skipping for data extraction.")
-                else:
-                    print(f"File ID {file_id} not completed or not found in parsing_status. Skipping for data extraction.")
-            
-            for future in futures:
-                try:
-                    processed_file_id, processed_filename, df_properties = future.result()
-                    if df_properties is not None and not df_properties.empty:
-                        df_properties_copy = df_properties.copy()
-                        df_properties_copy['Source Model'] = processed_filename # Add source model column
-                        all_data_frames.append(df_properties_copy)
-                        processed_count += 1
-                    else:
-                        print(f"No DataFrame or empty DataFrame for file ID: {processed_file_id} after processing.")
-                except Exception as e:
-                    current_app.logger.error(f"Error processing file in thread for data extraction: {e}", exc_info=True)
-
-        if not all_data_frames:
-            return jsonify({"message": "No data extracted. Selected files might be empty or failed processing.", "data": []}), 200
-
-        df_combined = pd.concat(all_data_frames, ignore_index=True)
-        data_for_frontend = df_combined.fillna(value=pd.NA).to_dict(orient='records')
-        data_for_frontend = [{k: (None if pd.isna(v) else v) for k, v in record.items()} for record in data_for_frontend]
-
-        message = f"Data extracted from {processed_count} file(s). Total records: {len(data_for_frontend)}."
-        return jsonify({"message": message, "data": data_for_frontend}), 200
-
-    except Exception as e:
-        current_app.logger.error(f"Error during data extraction: {e}", exc_info=True)
-        return jsonify({"error": f"An unexpected error occurred during data extraction: {str(e)}"}), 500
-
-
-@app.route('/api/generate_chart', methods=['POST'])
-def generate_chart():
-    """Generates charts for selected processed IFC files."""
-    try:
-        data = request.get_json()
-        if not data or 'file_ids' not in data or not isinstance(data['file_ids'], list):
-            return jsonify({"error": "Missing or invalid 'file_ids' list in request body"}), 400
-
-        file_ids = data['file_ids']
-        if not file_ids:
-            return jsonify({"error": "'file_ids' list cannot be empty"}), 400
-
-        charts_data = []
-        processed_count = 0
-
-        with ThreadPoolExecutor(max_workers=min(5, len(file_ids))) as executor:
-            futures = []
-            for file_id in file_ids:
-                if file_id in parsing_status and parsing_status[file_id]['status'] == 'completed':
-                    if file_id in uploaded_files_metadata:
-                        file_info = uploaded_files_metadata[file_id]
-                        futures.append(executor.submit(process_single_ifc_file, file_id, file_info, app.config))
-                    else:
-                        print(f"File ID {file_id} not found in uploaded_files_metadata. Skipping for chart generation.")
-                else:
-                    print(f"File ID {file_id} not completed or not found in parsing_status. Skipping for chart generation.")
-
-            for future in futures:
-                try:
-                    processed_file_id, processed_filename, df_properties = future.result()
-                    if df_properties is not None and not df_properties.empty:
-                        # Generate chart for this specific file's data
-                        _, chart_image_base64 = data_visualizer.plot_entity_counts(df_properties.copy())
-                        if chart_image_base64:
-                            charts_data.append({
-                                "file_id": processed_file_id,
-                                "filename": processed_filename,
-                                "chart_base64": chart_image_base64
-                            })
-                            processed_count += 1
-                        else:
-                            print(f"Chart generation failed for {processed_filename}.")
-                    else:
-                        print(f"No DataFrame or empty DataFrame for file ID: {processed_file_id}. Cannot generate chart.")
-                except Exception as e:
-                    current_app.logger.error(f"Error processing file in thread for chart generation: {e}", exc_info=True)
-
-        if not charts_data:
-            return jsonify({"message": "No charts generated. Selected files might be empty or failed processing.", "charts": []}), 200
-        
-        message = f"{len(charts_data)} chart(s) generated successfully from {processed_count} file(s)."
-        return jsonify({"message": message, "charts": charts_data}), 200
-
-    except Exception as e:
-        current_app.logger.error(f"Error during chart generation: {e}", exc_info=True)
-        return jsonify({"error": f"An unexpected error occurred during chart generation: {str(e)}"}), 500
-
-
-@app.route('/api/generate_graph', methods=['POST'])
-def generate_graph():
-    """Generates a knowledge graph for a single processed IFC file."""
-    try:
-        data = request.get_json()
-        if not data or 'file_id' not in data or not isinstance(data['file_id'], str):
-            return jsonify({"error": "Missing or invalid 'file_id' (string) in request body"}), 400
-
-        file_id = data['file_id']
-        if not file_id:
-            return jsonify({"error": "'file_id' cannot be empty"}), 400
-
-        if not (file_id in parsing_status and parsing_status[file_id]['status'] == 'completed' and file_id in uploaded_files_metadata):
-            return jsonify({"error": f"File ID {file_id} not found, not processed, or metadata missing."}), 404
-
-        file_info = uploaded_files_metadata[file_id]
-        _, filename, df_properties = process_single_ifc_file(file_id, file_info, app.config)
-
-        if df_properties is None or df_properties.empty:
-            return jsonify({"error": f"No data available for file {filename} (ID: {file_id}) to generate graph."}), 400
-
-        # Simple graph: IfcEntity -> PropertySet (if both columns exist)
-        G = nx.DiGraph()
-        if 'IfcEntity' in df_properties.columns and 'PropertySet' in df_properties.columns:
-            for _, row in df_properties.iterrows():
-                entity = row['IfcEntity']
-                pset = row['PropertySet']
-                if pd.notna(entity) and pd.notna(pset):
-                    G.add_node(str(entity), type='IfcEntity')
-                    G.add_node(str(pset), type='PropertySet')
-                    G.add_edge(str(entity), str(pset))
-        
-        if not G.nodes:
-            return jsonify({"message": f"No graph data (nodes/edges) could be generated for {filename}.", "graph_path": None}), 200
-
-        plt.figure(figsize=(12, 12))
-        pos = nx.spring_layout(G, k=0.15, iterations=20)
-        nx.draw(G, pos, with_labels=True, node_size=500, node_color="skyblue", font_size=8, arrows=True)
-        plt.title(f"Knowledge Graph for {filename}")
-        
-        graph_filename = f"graph_{file_id.replace('-', '_')}.png"
-        graph_file_path = os.path.join(GRAPHS_FOLDER, graph_filename)
-        plt.savefig(graph_file_path)
-        plt.close() # Close the figure to free memory
-
-        # Construct URL for the frontend
-        # serve_generated_content serves from STATIC_FOLDER (backend/static)
-        # So, path should be relative to STATIC_FOLDER
-        relative_graph_path = os.path.join(GRAPHS_SUBDIR, graph_filename).replace('\\', '/')
-        graph_url = f"/generated_content/{relative_graph_path}"
-
-        return jsonify({"message": f"Graph generated successfully for {filename}.", "graph_path": graph_url}), 200
-
-    except Exception as e:
-        current_app.logger.error(f"Error during graph generation: {e}", exc_info=True)
-        return jsonify({"error": f"An unexpected error occurred during graph generation: {str(e)}"}), 500
-
-
-# --- Asynchronous Parsing Task --- 
-def parse_ifc_file_async(file_id, ifc_file_path, output_dir):
-    """
-    Parses an IFC file asynchronously, updates status, and saves results.
-    This function is run in a separate thread.
-    """
-    if file_id not in parsing_status:
-        print(f"Error: file_id {file_id} not found in parsing_status for async task.")
-        return
-
-    parsing_status[file_id]['status'] = 'processing'
-    print(f"Async parsing started for file_id: {file_id}, path: {ifc_file_path}")
-
-    try:
-        # Call the parser function from ifc_parser module
-        # output_dir here is app.config['CACHE_FOLDER'] passed from the upload endpoint
-        csv_path, json_path = ifc_parser.parse_ifc_to_files(ifc_file_path, output_dir, file_id)
-
-        if csv_path and json_path:
-            parsing_status[file_id]['status'] = 'completed'
-            parsing_status[file_id]['result'] = {
-                'csv_path': os.path.relpath(csv_path, os.path.dirname(__file__)), 
-                'json_path': os.path.relpath(json_path, os.path.dirname(__file__)) 
-            }
-            parsing_status[file_id]['error'] = None
-            print(f"Async parsing completed for file_id: {file_id}. CSV: {csv_path}, JSON: {json_path}")
-        else:
-            parsing_status[file_id]['status'] = 'failed'
-            parsing_status[file_id]['error'] = 'Parsing completed but no output files were generated.'
-            print(f"Async parsing failed for file_id: {file_id}. No output files.")
-
-    except Exception as e:
-        parsing_status[file_id]['status'] = 'failed'
-        parsing_status[file_id]['error'] = str(e)
-        print(f"Exception during async parsing for file_id {file_id}: {e}")
-
-
-# --- Endpoint for Checking Parsing Status --- 
-@app.route('/api/status/<file_id>', methods=['GET'])
-def get_parsing_status(file_id):
-    """
-    Endpoint to check the parsing status of a file.
-    """
-    if file_id in parsing_status:
-        status_info = parsing_status[file_id]
-        return jsonify(status_info), 200
-    else:
-        return jsonify({"error": "File ID not found"}), 404
-
-@app.route('/hello')
-def hello():
-    return "Hello, World!"
-
-@app.route('/')
-def serve_index():
-    """Serves the main index.html file for the frontend."""
-    # os.path.dirname(__file__) is /backend
-    # os.path.join(os.path.dirname(__file__), '..', 'frontend') is /frontend
-    frontend_dir = os.path.join(os.path.dirname(__file__), '..', 'frontend')
-    return send_from_directory(frontend_dir, 'index.html')
-
-# Note: Flask is already configured to serve static files from '../frontend/static'
-# via the static_folder parameter in app = Flask(...).
-# So, requests to /static/css/style.css will correctly serve frontend/static/css/style.css.
-# No explicit @app.route('/static/...') for frontend static files is needed here.
-
-# --- Serve Backend Generated Static Files ---
-# This is for files generated by the backend, like plots or reports,
-# that might be stored in backend/static/
-# The existing STATIC_FOLDER variable (defined earlier in the script) points to backend/static/
-@app.route('/generated_content/<path:filename>')
-def serve_generated_content(filename):
-    """Serves files from the backend's dedicated static content folder (backend/static)."""
-    # STATIC_FOLDER is defined above as os.path.join(os.path.dirname(__file__), 'static')
-    return send_from_directory(STATIC_FOLDER, filename)
-
-# --- Main Execution ---
-if __name__ == '__main__':
-    # Avvia il server di sviluppo Flask
-    # debug=True ricarica automaticamente il server quando modifichi il codice
-    # e fornisce messaggi di errore più dettagliati nel browser.
-    # Non usare debug=True in produzione!
-    app.run(debug=True, host='0.0.0.0', port=5000) # Ascolta su tutte le interfacce sulla porta 5000
-
+# backend/app.py
+# File principale dell'applicazione backend Flask per IFC Analyzer AI.
+
+import atexit # For shutting down the shared executor
+import mimetypes # Content-Type dei file delegati a nginx via X-Accel-Redirect
+import os
+import shutil # Large-buffer streaming of raw uploads to disk
+import uuid # Added for unique file IDs
+import threading # Added for asynchronous processing
+from flask import Flask, request, jsonify, send_from_directory, current_app, Response # Added current_app
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.utils import secure_filename
+import orjson # Fast JSON encoding for large API responses
+import numpy as np # Memory-mapped edge-list caches for graph generation
+import pandas as pd
+import pyarrow as pa # Arrow IPC responses for large extractions
+import pyarrow.feather # Arrow Feather v2 for the DataFrame disk cache
+import pyarrow.parquet # Column-projected reads of the Parquet cache
+from concurrent.futures import ThreadPoolExecutor
+# Redis è opzionale: senza server (o senza libreria) lo stato di parsing resta
+# nel processo, come prima.
+try:
+    import redis
+except ImportError:
+    redis = None
+# Celery è opzionale: senza broker configurato il parsing resta sul pool di
+# thread in-process.
+try:
+    from celery import Celery
+except ImportError:
+    Celery = None
+import time # For creating unique file IDs if needed, and for thread pool operations
+import matplotlib
+matplotlib.use('Agg') # Headless backend: no GUI event loop, safe in threads
+matplotlib.rcParams['path.simplify_threshold'] = 1.0 # Cheaper vector path rendering
+# networkx and the Agg canvas/Figure classes are imported lazily inside
+# /api/generate_graph: they cost hundreds of ms and real RSS at startup but
+# only that endpoint needs them, so upload/extract/status stay lightweight.
+
+# Importa i moduli locali che abbiamo creato
+import ifc_parser 
+import data_visualizer # Importiamo il modulo per i grafici
+
+# --- Configurazione Iniziale ---
+
+# Crea l'istanza dell'applicazione Flask
+# Configure static_folder to point to frontend/static for serving CSS, JS directly
+# os.path.dirname(__file__) is the 'backend' directory
+frontend_static_dir = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'static')
+app = Flask(__name__, static_folder=frontend_static_dir)
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    Provider JSON basato su orjson: encoder C (escaping UTF-8 SIMD-aware),
+    2-5x lo stdlib sui payload piccoli. Così anche ogni jsonify() dell'app
+    passa da orjson, non solo le risposte costruite a mano.
+    """
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = ORJSONProvider(app)
+
+# Logger a WARNING di default: le debug() sui percorsi caldi diventano no-op
+# senza costo di formattazione né contesa sul lock di stdout tra i worker
+# (alzare con IFC_LOG_LEVEL=DEBUG quando serve il dettaglio).
+app.logger.setLevel(os.environ.get('IFC_LOG_LEVEL', 'WARNING'))
+
+# Configura una cartella per salvare i file IFC caricati
+UPLOAD_FOLDER = 'uploads' # Idealmente, questa dovrebbe essere in una sottocartella di 'backend'
+# Se app.py è in backend/, UPLOAD_FOLDER sarà backend/uploads/
+# Se app.py è nella root, UPLOAD_FOLDER sarà uploads/
+# Per coerenza con la struttura, assumiamo che app.py sia in backend/
+# e UPLOAD_FOLDER sia una sottocartella di backend/
+if not os.path.isabs(UPLOAD_FOLDER): # Se non è un percorso assoluto
+    UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), UPLOAD_FOLDER)
+
+if not os.path.exists(UPLOAD_FOLDER):
+    os.makedirs(UPLOAD_FOLDER)
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Rifiuta upload oltre questa soglia prima di toccare il disco (IFC multi-GB
+# sono legittimi, quindi il default è alto ma configurabile via env).
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('IFC_MAX_UPLOAD_BYTES', 8 * 1024 ** 3))
+# Dimensione del buffer per le scritture su disco degli upload: 1 MiB per
+# ammortizzare l'overhead per-chunk del parser multipart (default 16 KiB).
+UPLOAD_BUFFER_SIZE = 1 << 20
+
+# Configura una cartella per cachare i DataFrame processati
+CACHE_FOLDER = 'cache' # Sarà backend/cache/
+if not os.path.isabs(CACHE_FOLDER):
+    CACHE_FOLDER = os.path.join(os.path.dirname(__file__), CACHE_FOLDER)
+if not os.path.exists(CACHE_FOLDER):
+    os.makedirs(CACHE_FOLDER)
+app.config['CACHE_FOLDER'] = CACHE_FOLDER
+
+# Formato della cache DataFrame su disco: 'feather' (default, letture mmap
+# zero-copy) oppure 'parquet' (ZSTD, file 2-3x più piccoli e letture parziali
+# per colonna quando serve un sottoinsieme delle colonne).
+CACHE_FORMAT = os.environ.get('IFC_CACHE_FORMAT', 'feather')
+
+# Definisci le estensioni di file permesse (solo .ifc)
+ALLOWED_EXTENSIONS = {'ifc'}
+# Tupla precomputata di suffissi: str.endswith su una tupla è un'unica
+# chiamata C, senza l'allocazione di rsplit per ogni file sul percorso caldo.
+_ALLOWED_SUFFIXES = tuple('.' + ext for ext in ALLOWED_EXTENSIONS)
+
+def allowed_file(filename):
+    """Verifica se l'estensione del file è permessa."""
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
+
+# Configura una cartella per i file statici (es. grafici generati)
+STATIC_FOLDER = 'static' # Sarà backend/static/
+if not os.path.isabs(STATIC_FOLDER):
+    STATIC_FOLDER = os.path.join(os.path.dirname(__file__), STATIC_FOLDER)
+
+PLOTS_SUBDIR = 'plots' # Sottocartella per i grafici
+PLOTS_FOLDER = os.path.join(STATIC_FOLDER, PLOTS_SUBDIR) # Sarà backend/static/plots/
+if not os.path.exists(PLOTS_FOLDER):
+    os.makedirs(PLOTS_FOLDER)
+
+GRAPHS_SUBDIR = 'graphs' # Sottocartella per i grafici di conoscenza
+GRAPHS_FOLDER = os.path.join(STATIC_FOLDER, GRAPHS_SUBDIR) # Sarà backend/static/graphs/
+if not os.path.exists(GRAPHS_FOLDER):
+    os.makedirs(GRAPHS_FOLDER)
+
+# Flask serve automaticamente i file dalla cartella 'static' se è al livello root dell'app.
+# Se 'static' è dentro 'backend', potremmo dover configurare diversamente o servire manualmente.
+# Per semplicità, Flask cerca 'static' relativo a dove l'app è inizializzata.
+# Se app è in backend/, Flask cercherà backend/static.
+
+class ShardedDict:
+    """
+    Thread-safe mapping sharded over N independent locks.
+
+    Upload handlers, pool workers and status polls all touch the shared
+    file-tracking maps concurrently; before this the background parser and
+    the status endpoint raced on plain dict entries, correct only by GIL
+    accident. Sharding by key hash keeps the critical sections short and
+    avoids funnelling every request through one global lock: operations on
+    different file_ids proceed in parallel on independent locks.
+    """
+    NSHARDS = 16 # Potenza di due: lo shard si sceglie con un AND bit a bit
+
+    def __init__(self):
+        self._shards = [{} for _ in range(self.NSHARDS)]
+        self._locks = [threading.Lock() for _ in range(self.NSHARDS)]
+
+    def _shard(self, key):
+        index = hash(key) & (self.NSHARDS - 1)
+        return self._shards[index], self._locks[index]
+
+    def get(self, key, default=None):
+        shard, lock = self._shard(key)
+        with lock:
+            return shard.get(key, default)
+
+    def set(self, key, value):
+        shard, lock = self._shard(key)
+        with lock:
+            shard[key] = value
+
+    def update_fields(self, key, **fields):
+        """Read-modify-write of an entry's fields under the shard lock."""
+        shard, lock = self._shard(key)
+        with lock:
+            entry = shard.get(key)
+            if entry is None:
+                return False
+            entry.update(fields)
+            return True
+
+    def __contains__(self, key):
+        shard, lock = self._shard(key)
+        with lock:
+            return key in shard
+
+
+# Struttura dati temporanea per tenere traccia dei file caricati e dei loro metadati
+# In un'applicazione reale, useresti un database.
+# La chiave sarà un ID univoco generato, il valore un dizionario con i dettagli.
+uploaded_files_metadata = ShardedDict()
+
+# Process-wide worker pool shared by all requests: thread spin-up is paid once
+# at startup instead of per request, and the pandas-heavy workers keep better
+# cache locality. Size is tunable via the IFC_WORKERS env var.
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('IFC_WORKERS', os.cpu_count() or 4)),
+    thread_name_prefix='ifc-worker'
+)
+atexit.register(EXECUTOR.shutdown)
+
+class RedisStatusStore:
+    """
+    Stato di parsing su Redis, condiviso tra worker/processi.
+
+    Con più worker gunicorn un dict per-processo dà risposte incoerenti ai
+    poll di stato e cresce senza limiti; qui ogni voce è un blob orjson con
+    TTL, quindi letture O(1) via rete, memoria limitata e vista consistente.
+    Un piccolo L1 in-process (scadenza 1 s, invalidato a ogni scrittura)
+    assorbe le raffiche di polling del frontend senza colpire Redis.
+    Espone la stessa interfaccia di ShardedDict.
+    """
+    TTL_SECONDS = 3600
+    L1_TTL_SECONDS = 1.0
+    # Oltre questa soglia le voci L1 scadute vengono sfoltite alla scrittura:
+    # senza un tetto la mappa crescerebbe di una voce per file_id mai letto.
+    L1_MAX_ENTRIES = 1024
+
+    def __init__(self, client):
+        self._client = client
+        self._l1 = {}
+        self._l1_lock = threading.Lock()
+
+    def _key(self, key):
+        return f"parse:{key}"
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._l1_lock:
+            hit = self._l1.get(key)
+            if hit is not None:
+                if hit[0] > now:
+                    return hit[1]
+                # Scaduta: rimossa subito invece di aspettare una set() che
+                # per i file ormai completati non arriverà mai.
+                del self._l1[key]
+        blob = self._client.get(self._key(key))
+        if blob is None:
+            return default
+        value = orjson.loads(blob)
+        with self._l1_lock:
+            if len(self._l1) >= self.L1_MAX_ENTRIES:
+                for stale_key in [k for k, (deadline, _) in self._l1.items()
+                                  if deadline <= now]:
+                    self._l1.pop(stale_key, None)
+            self._l1[key] = (now + self.L1_TTL_SECONDS, value)
+        return value
+
+    def set(self, key, value):
+        self._client.set(self._key(key), orjson.dumps(value), ex=self.TTL_SECONDS)
+        with self._l1_lock:
+            self._l1.pop(key, None)
+
+    def update_fields(self, key, **fields):
+        """Read-modify-write; il worker di parsing è l'unico scrittore per chiave."""
+        entry = self.get(key)
+        if entry is None:
+            return False
+        entry.update(fields)
+        self.set(key, entry)
+        return True
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+# Coda di job dedicata per il parsing: con IFC_CELERY_BROKER configurato (e
+# Celery installato) il lavoro pesante gira in worker prefork separati che non
+# competono con le richieste HTTP e scalano su più core oltre il GIL
+# (celery -A app.celery worker --pool=prefork --concurrency=<n core>).
+# Lo stato continua a fluire in parsing_status (Redis-backed quando
+# configurato, vedi sopra), quindi i poll di stato non cambiano.
+CELERY_BROKER_URL = os.environ.get('IFC_CELERY_BROKER')
+if Celery is not None and CELERY_BROKER_URL:
+    celery = Celery('openbimrag',
+                    broker=CELERY_BROKER_URL,
+                    backend=os.environ.get('IFC_CELERY_BACKEND', CELERY_BROKER_URL))
+    # Coda separata per lo step di parse, scalabile indipendentemente.
+    celery.conf.task_routes = {'openbimrag.parse_ifc': {'queue': 'parse'}}
+
+    @celery.task(name='openbimrag.parse_ifc')
+    def parse_ifc_task(file_id, ifc_file_path, output_dir):
+        parse_ifc_file_async(file_id, ifc_file_path, output_dir)
+
+    def submit_parse_job(file_id, ifc_file_path):
+        parse_ifc_task.delay(file_id, ifc_file_path, app.config['CACHE_FOLDER'])
+else:
+    celery = None
+
+    def submit_parse_job(file_id, ifc_file_path):
+        EXECUTOR.submit(parse_ifc_file_async, file_id, ifc_file_path, app.config['CACHE_FOLDER'])
+
+
+# Sharded map of parsing-task statuses
+# Key: file_id, Value: {status: 'pending'/'processing'/'completed'/'failed', original_filename: '...', result: {'csv_path': ..., 'json_path': ...} or None, error: str or None}
+# Con IFC_REDIS_URL configurato (e redis-py installato) lo stato vive in
+# Redis ed è condiviso tra processi; altrimenti resta in-process come prima.
+_REDIS_URL = os.environ.get('IFC_REDIS_URL')
+if redis is not None and _REDIS_URL:
+    parsing_status = RedisStatusStore(redis.Redis.from_url(_REDIS_URL))
+else:
+    parsing_status = ShardedDict()
+
+def _write_edges_cache(file_id, df_properties, cache_folder):
+    """
+    Materializza la proiezione (entità, PropertySet) deduplicata come coppia
+    di array in un .npz. Prodotta una volta al parse, viene consumata da
+    /api/generate_graph che così non rilegge mai la tabella completa.
+    Ritorna il percorso scritto, o None se le colonne non ci sono.
+    """
+    entity_col = 'IFC_Entity' if 'IFC_Entity' in df_properties.columns else 'IfcEntity'
+    if entity_col not in df_properties.columns or 'PropertySet' not in df_properties.columns:
+        return None
+    pairs = df_properties[[entity_col, 'PropertySet']].dropna().astype(str).drop_duplicates()
+    if pairs.empty:
+        return None
+    edges_path = os.path.join(cache_folder, f"graph_{file_id.replace('-', '_')}_edges.npz")
+    np.savez(edges_path,
+             src=pairs[entity_col].to_numpy().astype(str),
+             dst=pairs['PropertySet'].to_numpy().astype(str))
+    return edges_path
+
+
+def _optimize_dtypes(df):
+    """
+    Compatta i dtype di un DataFrame appena parsato prima della cache.
+
+    Le colonne object a bassa cardinalità (IFC_Entity, PropertySet, ...)
+    diventano category (un codice intero per riga invece di un puntatore a
+    str), i numerici vengono downcastati al tipo più piccolo che li contiene.
+    Taglia memoria e byte su disco di 2-4x e rende proporzionalmente più
+    veloci concat, serializzazione JSON e letture della cache.
+    """
+    n_rows = len(df)
+    if n_rows == 0:
+        return df
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == 'object':
+            if series.nunique(dropna=True) / n_rows < 0.5:
+                df[col] = series.astype('category')
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast='float')
+    return df
+
+
+# --- Caricamento/parsing di un singolo file ---
+# Il percorso è diviso in due funzioni specializzate: nella stragrande
+# maggioranza delle richieste la cache su disco è già calda, quindi il caso
+# comune (load_cached_df) resta un singolo mmap + to_pandas senza i rami e le
+# stat del caso freddo; parse_and_cache gestisce solo il primo accesso.
+
+def load_cached_df(file_info, columns=None):
+    """
+    Fast path: carica il DataFrame dalla cache su disco, o None se assente.
+
+    Feather viene letto in memory-map (zero-copy); Parquet con proiezione di
+    colonna; il pickle legacy viene migrato a Feather al primo accesso.
+    """
+    cached_df_path = file_info.get("cached_df_path")
+    if not cached_df_path:
+        return None
+    # EAFP: si apre direttamente e si gestisce l'assenza del file, invece di
+    # pagare una stat() per ogni hit (non gratis su filesystem di rete).
+    try:
+        if cached_df_path.endswith('.pkl'):
+            # Legacy pickle cache: load it once, then rewrite as Feather so
+            # the next hit takes the fast zero-copy path.
+            df = pd.read_pickle(cached_df_path)
+            feather_path = cached_df_path[:-len('.pkl')] + '.feather'
+            try:
+                pyarrow.feather.write_feather(df, feather_path, compression='lz4')
+                file_info["cached_df_path"] = feather_path
+                app.logger.debug("Migrated legacy pickle cache to Feather: %s", feather_path)
+            except Exception as migrate_e:
+                # Atteso per i DataFrame con PropertyValue a tipi misti, che
+                # Arrow non converte: il pickle resta la cache di questi file.
+                app.logger.debug("Could not migrate pickle cache to Feather: %s", migrate_e)
+            return df
+        if cached_df_path.endswith('.parquet'):
+            # Parquet (ZSTD): column chunks are only read when requested,
+            # so projecting to `columns` reads only those columns' bytes.
+            use_cols = None
+            if columns is not None:
+                schema_names = pyarrow.parquet.ParquetFile(cached_df_path).schema_arrow.names
+                use_cols = [c for c in columns if c in schema_names] or None
+            return pd.read_parquet(cached_df_path, engine='pyarrow', columns=use_cols)
+        # Feather v2 (Arrow IPC): memory-mapped, zero-copy read.
+        use_cols = None
+        if columns is not None:
+            schema_names = pa.ipc.open_file(pa.memory_map(cached_df_path)).schema.names
+            use_cols = [c for c in columns if c in schema_names] or None
+        return pyarrow.feather.read_feather(cached_df_path, columns=use_cols, memory_map=True)
+    except FileNotFoundError:
+        # Cache evicted/cleaned since the path was recorded: just a cold miss.
+        return None
+    except Exception as e:
+        app.logger.warning("Error loading DataFrame from disk cache %s: %s. Will try other methods.", cached_df_path, e)
+        return None
+
+
+def parse_and_cache(file_id, file_info, app_config):
+    """
+    Slow path (primo accesso): parsa l'IFC, compatta i dtype e scrive la
+    cache su disco. Restituisce sempre un DataFrame (vuoto in caso di errore).
+    """
+    filepath = file_info.get("saved_path")
+    app.logger.debug("DataFrame for file ID %s not found in disk or memory cache. Loading from IFC...", file_id)
+    if not filepath:
+        app.logger.warning("Original IFC file path not recorded for %s.", file_id)
+        return pd.DataFrame()
+
+    try:
+        # Corrected: extract_properties_from_ifc returns only the DataFrame
+        parsed_df = ifc_parser.extract_properties_from_ifc(filepath)
+        app.logger.debug("[Debug] For file ID %s, parsed_df type: %s, Shape: %s", file_id, type(parsed_df), parsed_df.shape if hasattr(parsed_df, 'shape') else 'N/A')
+        if parsed_df is None:
+            app.logger.warning("Parsing IFC for %s did not return a DataFrame (returned None).", file_id)
+            return pd.DataFrame()
+
+        # Compact dtypes once here so both the in-memory frame and
+        # the disk cache benefit on every later read.
+        df_properties = _optimize_dtypes(parsed_df)
+        file_info["processed_data_df"] = df_properties
+        app.logger.debug("Successfully parsed IFC; loaded properties for file ID: %s. Rows: %s", file_id, len(df_properties) if not df_properties.empty else 0)
+        if df_properties.empty:
+            app.logger.debug("Parsed IFC for %s, but it resulted in an empty DataFrame. Not caching to disk.", file_id)
+            return df_properties
+
+        cache_ext = 'parquet' if CACHE_FORMAT == 'parquet' else 'feather'
+        new_cache_filename = f"{file_id.replace('-', '_')}_df.{cache_ext}" # Ensure filename is valid
+        new_cache_filepath = os.path.join(app_config['CACHE_FOLDER'], new_cache_filename)
+        try:
+            if CACHE_FORMAT == 'parquet':
+                df_properties.to_parquet(new_cache_filepath, compression='zstd', engine='pyarrow', index=False)
+            else:
+                pyarrow.feather.write_feather(df_properties, new_cache_filepath, compression='lz4')
+            file_info["cached_df_path"] = new_cache_filepath
+            app.logger.debug("Successfully cached newly parsed DataFrame to disk: %s", new_cache_filepath)
+        except Exception as cache_save_e:
+            # Caso tipico: ArrowInvalid sulla colonna PropertyValue, che
+            # mescola bool/str/numeri (i wrappedValue IFC). Il pickle fa
+            # round-trip delle colonne object miste senza perdita: meglio una
+            # cache più lenta che nessuna cache, altrimenti ogni lettura
+            # successiva sarebbe un re-parse completo dell'IFC.
+            app.logger.warning("Error saving newly parsed DataFrame to cache for %s: %s. Falling back to pickle.", file_id, cache_save_e)
+            try:
+                pickle_filepath = os.path.join(app_config['CACHE_FOLDER'], f"{file_id.replace('-', '_')}_df.pkl")
+                df_properties.to_pickle(pickle_filepath)
+                file_info["cached_df_path"] = pickle_filepath
+                app.logger.debug("Cached newly parsed DataFrame as pickle: %s", pickle_filepath)
+            except Exception as pickle_save_e:
+                app.logger.warning("Pickle cache fallback also failed for %s: %s", file_id, pickle_save_e)
+        try:
+            # Precompute the graph edge list now, while the frame is hot:
+            # even the first /api/generate_graph call becomes a pure mmap.
+            edges_path = _write_edges_cache(file_id, df_properties, app_config['CACHE_FOLDER'])
+            if edges_path:
+                file_info["edges_cache_path"] = edges_path
+        except Exception as edges_e:
+            app.logger.warning("Could not persist edge cache for %s: %s", file_id, edges_e)
+        return df_properties
+    except FileNotFoundError:
+        app.logger.warning("Original IFC file not found on disk for %s: %s", file_id, filepath)
+        return pd.DataFrame()
+    except Exception as parse_e:
+        app.logger.warning("Error parsing IFC file %s for file ID %s: %s", filepath, file_id, parse_e)
+        current_app.logger.error(f"Exception during IFC parsing for {file_id} ({filepath}): {parse_e}", exc_info=True)
+        return pd.DataFrame()
+
+
+def process_single_ifc_file(file_id, file_info, app_config, columns=None):
+    filename = file_info.get("original_filename", "Unknown File") # Use original_filename for consistency
+
+    df_properties = load_cached_df(file_info, columns=columns)
+    if df_properties is not None:
+        if columns is None:
+            # Only full frames go in the in-memory cache; a projected read
+            # must not shadow the complete table for later callers.
+            file_info["processed_data_df"] = df_properties
+        app.logger.debug("Successfully loaded DataFrame from disk cache for file ID: %s. Rows: %s", file_id, len(df_properties))
+        return file_id, filename, df_properties
+
+    df_properties = file_info.get("processed_data_df")
+    if df_properties is not None:
+        app.logger.debug("Using existing in-memory DataFrame for file ID: %s. Rows: %s", file_id, len(df_properties) if not df_properties.empty else 0)
+        return file_id, filename, df_properties
+
+    return file_id, filename, parse_and_cache(file_id, file_info, app_config)
+
+
+# --- Endpoint API ---
+
+@app.route('/api/upload', methods=['POST'])
+def upload_ifc_files():
+    """
+    Endpoint per caricare uno o più file IFC.
+    Salva i file nella UPLOAD_FOLDER e estrae i metadati iniziali.
+    """
+    if 'ifcFiles' not in request.files:
+        # Use English for API error responses
+        return jsonify({"error": "No 'ifcFiles' part in the request"}), 400
+
+    files = request.files.getlist('ifcFiles') # Gestisce caricamenti multipli
+    
+    uploaded_file_info = [] # Lista per restituire info sui file caricati con successo
+
+    for file in files:
+        if file.filename == '':
+            # Salta i file senza nome (potrebbe accadere se il campo è vuoto)
+            continue 
+            
+        # Una sola verifica dell'estensione per file (prima era ripetuta
+        # nel ramo elif), riusata in entrambi i rami.
+        is_allowed = allowed_file(file.filename)
+        if file and is_allowed:
+            # Rendi sicuro il nome del file per evitare problemi di sicurezza/percorso
+            filename = secure_filename(file.filename)
+            
+            # Crea un percorso completo per salvare il file
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            
+            try:
+                # Copia lo stream su disco a blocchi da 1 MiB, senza il layer
+                # di FileStorage.save: un solo passaggio sui byte, file
+                # aperto senza buffering intermedio (i chunk sono già grandi).
+                with open(filepath, 'wb', buffering=0) as out:
+                    shutil.copyfileobj(file.stream, out, length=UPLOAD_BUFFER_SIZE)
+                # Use English for server logs
+                app.logger.debug("File saved: %s", filepath)
+
+                # Estrai i metadati usando la funzione dal nostro parser
+                # ifc_parser è nella stessa cartella backend/
+                # Estrai solo i metadati base usando la funzione dal nostro parser
+                # ifc_parser è nella stessa cartella backend/
+                fname, schema, software = ifc_parser.extract_ifc_metadata(filepath)
+
+                if fname: # Se l'estrazione dei metadati base ha successo
+                    file_id = str(uuid.uuid4()) # Genera un ID univoco
+                    
+                    # Store initial metadata and set parsing status to "pending"
+                    parsing_status.set(file_id, {
+                        "status": "pending",
+                        "original_filename": filename,
+                        "schema": schema,
+                        "software": software,
+                        "saved_path": filepath, # Store path for the thread
+                        "result": None,
+                        "error": None
+                    })
+
+                    # Store basic info in uploaded_files_metadata as well, if needed for other parts of the app
+                    # This part might be refactored later if all info moves to parsing_status
+                    uploaded_files_metadata.set(file_id, {
+                        "original_filename": filename,
+                        "saved_path": filepath,
+                        "schema": schema,
+                        "software": software,
+                        "discipline": None, # Potrebbe essere popolato in seguito
+                        "processed_data_df": None, # Questo è per la query ITO, non per il parsing iniziale
+                        "cached_df_path": None
+                    })
+
+                    # Submit parsing to the job queue (Celery when configured,
+                    # otherwise the shared in-process worker pool).
+                    submit_parse_job(file_id, filepath)
+
+                    # Add info to return to the frontend (ID and basic info for status polling)
+                    uploaded_file_info.append({
+                        "id": file_id,
+                        "filename": filename,
+                        "schema": schema,
+                        "software": software,
+                        "status": "processing" # Inform frontend that processing has started
+                    })
+                    app.logger.debug("File %s (ID: %s) received. Asynchronous parsing started.", filename, file_id)
+                else:
+                    # Se l'estrazione dei metadati base fallisce
+                    app.logger.warning("Core metadata (fname, schema, software) not extracted for %s, file was saved but not processed further.", filename)
+                    # Considera se eliminare il file o gestirlo diversamente
+
+            except Exception as e:
+                 # Use English for server error logs
+                app.logger.warning("Error during saving or metadata analysis for %s: %s", filename, e)
+                # Potresti voler restituire un errore specifico per questo file
+                
+        elif file and not is_allowed:
+             # Use English for server warnings/logs
+             app.logger.warning("File not allowed: %s", file.filename)
+             # Potresti voler informare l'utente specificamente per questo file
+
+    if not uploaded_file_info:
+         # Use English for API error responses
+         return jsonify({"error": "No valid IFC files uploaded or processed"}), 400
+
+    # Restituisce l'elenco dei file caricati con successo e i loro metadati base.
+    # Il messaggio ora riflette che il caricamento è veloce e il processamento completo è differito.
+    if not uploaded_file_info:
+        message = "No valid IFC files were processed or initiated for parsing."
+        return jsonify({"message": message, "files": []}), 400 # Bad request if no files are good
+    
+    message = f"{len(uploaded_file_info)} IFC file(s) received. Processing started in background."
+    return jsonify({"message": message, 
+                    "files": uploaded_file_info}), 202 # 202 Accepted, processing not complete
+
+
+@app.route('/api/upload/<filename>', methods=['PUT'])
+def upload_ifc_file_raw(filename):
+    """
+    Variante streaming dell'upload: il corpo della richiesta è il file IFC
+    grezzo (niente multipart), copiato su disco a blocchi da 1 MiB con
+    shutil.copyfileobj. Per file multi-GB evita interamente il parser
+    multipart di Werkzeug e il suo overhead per-chunk.
+    """
+    filename = secure_filename(filename)
+    if not filename or not allowed_file(filename):
+        return jsonify({"error": "Filename missing or extension not allowed"}), 400
+
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    try:
+        with open(filepath, 'wb') as out:
+            shutil.copyfileobj(request.stream, out, length=UPLOAD_BUFFER_SIZE)
+        app.logger.debug("File saved (streamed): %s", filepath)
+
+        fname, schema, software = ifc_parser.extract_ifc_metadata(filepath)
+        if not fname:
+            return jsonify({"error": f"Could not extract IFC metadata from {filename}"}), 400
+
+        file_id = str(uuid.uuid4())
+        parsing_status.set(file_id, {
+            "status": "pending",
+            "original_filename": filename,
+            "schema": schema,
+            "software": software,
+            "saved_path": filepath,
+            "result": None,
+            "error": None
+        })
+        uploaded_files_metadata.set(file_id, {
+            "original_filename": filename,
+            "saved_path": filepath,
+            "schema": schema,
+            "software": software,
+            "discipline": None,
+            "processed_data_df": None,
+            "cached_df_path": None
+        })
+        submit_parse_job(file_id, filepath)
+
+        return jsonify({"message": f"IFC file {filename} received. Processing started in background.",
+                        "files": [{
+                            "id": file_id,
+                            "filename": filename,
+                            "schema": schema,
+                            "software": software,
+                            "status": "processing"
+                        }]}), 202
+    except Exception as e:
+        app.logger.warning("Error during streamed upload of %s: %s", filename, e)
+        return jsonify({"error": f"An unexpected error occurred during upload: {str(e)}"}), 500
+
+
+# @app.route('/api/run_ito_query', methods=['POST'])
+# def run_ito_query():
+#     """
+#     Endpoint per eseguire una query ITO sui file selezionati.
+#     Estrae proprietà, filtra per tipo entità (query) e genera un grafico per ogni file.
+#     """
+#     try:
+#         data = request.get_json()
+#         if not data:
+#             return jsonify({"error": "Request body must be JSON"}), 400
+
+#         query_string = data.get('query') # Es. "IfcWall", "IfcDoor" (può essere None o vuoto)
+#         file_ids = data.get('file_ids') # Lista di ID dei file selezionati dal frontend
+
+#         if not file_ids or not isinstance(file_ids, list):
+#             return jsonify({"error": "Missing or invalid 'file_ids' list in request body"}), 400
+
+#         app.logger.debug("Received ITO query: '%s' for file IDs: %s", query_string, file_ids)
+
+#         all_data_frames = []
+#         charts_data = [] # New list to store individual chart data
+#         futures = []
+
+#         # Use a ThreadPoolExecutor to process files concurrently
+#         # The number of max_workers can be adjusted based on typical number of files and server resources
+#         with ThreadPoolExecutor(max_workers=min(5, len(file_ids) if file_ids else 1)) as executor:
+#             for file_id in file_ids:
+#                 if file_id in uploaded_files_metadata:
+#                     file_info = uploaded_files_metadata[file_id]
+#                     # Pass app.config to the helper function for CACHE_FOLDER access
+#                     futures.append(executor.submit(process_single_ifc_file, file_id, file_info, app.config))
+#                 else:
+#                     app.logger.warning("File ID %s not found in uploaded_files_metadata. Skipping.", file_id)
+
+#             for future in futures:
+#                 try:
+#                     processed_file_id, processed_filename, df_properties = future.result() # Timeout can be added here
+#                     if df_properties is not None and not df_properties.empty:
+#                         all_data_frames.append(df_properties.assign(**{'Source Model': processed_filename}))
+
+#                         # Generate chart for this specific file's data
+#                         df_for_chart = df_properties.copy() # Start with a copy to ensure original df_properties is not altered
+#                         # query_string is no longer used for initial chart filtering here
+#                         # The chart will always be based on the full data for the file initially
+                        
+#                         if not df_for_chart.empty:
+#                             _, chart_image_base64 = data_visualizer.plot_entity_counts(df_for_chart)
+#                             if chart_image_base64:
+#                                 charts_data.append({
+#                                     "file_id": processed_file_id,
+#                                     "filename": processed_filename,
+#                                     "chart_base64": chart_image_base64,
+#                                     "query_used_for_chart": "All Entities" # Always all entities for initial chart
+#                                 })
+#                             else:
+#                                 app.logger.warning("Chart generation failed for %s using query 'All Entities'", processed_filename)
+#                         else:
+#                             app.logger.debug("No data to generate chart for %s (displaying all entities)", processed_filename)
+#                     else:
+#                         app.logger.debug("No properties DataFrame available or it's empty for file ID: %s. Skipping for table and chart.", processed_file_id)
+#                 except Exception as e:
+#                     # Log the exception from the thread
+#                     current_app.logger.error(f"Error processing a file in thread: {e}", exc_info=True)
+#                     # Optionally, you could add a placeholder or error message for this file in the response
+
+#         if not all_data_frames:
+#             app.logger.debug("No dataframes were processed or all were empty after concurrent processing.")
+#             return jsonify({
+#                 "message": "No data found for the selected files or query after processing.", 
+#                 "data": [], 
+#                 "charts_data": []
+#             }), 200
+
+#         # Combina tutti i DataFrame in uno solo per la tabella dei risultati
+#         df_combined = pd.concat(all_data_frames, ignore_index=True, copy=False) if all_data_frames else pd.DataFrame()
+
+#         # The initial query_string is no longer used for server-side table filtering.
+#         # All data is returned, and filtering is handled by the client-side "Filter Results" section.
+#         df_filtered_table = df_combined
+
+#         # Converti il DataFrame filtrato in JSON per la risposta
+#         # Un solo passaggio vettorizzato NaN->None (a livello C) al posto del
+#         # doppio giro fillna + pd.isna per ogni cella
+#         df_clean = df_filtered_table.astype(object).where(df_filtered_table.notna(), None)
+#         data_for_frontend = df_clean.to_dict(orient='records')
+
+
+#         message = f"Query processed for {len(file_ids)} file(s). All data returned for client-side filtering."
+        
+#         app.logger.debug("Returning %s records and %s charts.", len(data_for_frontend), len(charts_data))
+
+#         return jsonify({
+#             "message": message,
+#             "data": data_for_frontend,
+#             "charts_data": charts_data # Pass the list of chart data objects
+#         }), 200
+
+#     except Exception as e:
+#         current_app.logger.error(f"Error during ITO query: {e}", exc_info=True)
+#         # Use English for API error responses
+#         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+
+@app.route('/api/extract_data', methods=['POST'])
+def extract_data():
+    """Extracts data from selected processed IFC files and returns tabular results."""
+    try:
+        data = request.get_json()
+        if not data or 'file_ids' not in data or not isinstance(data['file_ids'], list):
+            return jsonify({"error": "Missing or invalid 'file_ids' list in request body"}), 400
+
+        file_ids = data['file_ids']
+        if not file_ids:
+            return jsonify({"error": "'file_ids' list cannot be empty"}), 400
+
+        all_data_frames = []
+        processed_count = 0
+
+        futures = []
+        for file_id in file_ids:
+            status_info = parsing_status.get(file_id)
+            if status_info and status_info['status'] == 'completed':
+                file_info = uploaded_files_metadata.get(file_id)
+                if file_info is not None:
+                    futures.append(EXECUTOR.submit(process_single_ifc_file, file_id, file_info, app.config))
+                else:
+                    app.logger.warning("File ID %s not found in uploaded_files_metadata. Skipping for data extraction.", file_id)
+            else:
+                app.logger.warning("File ID %s not completed or not found in parsing_status. Skipping for data extraction.", file_id)
+
+        extracted_frames = []
+        for future in futures:
+            try:
+                processed_file_id, processed_filename, df_properties = future.result()
+                if df_properties is not None and not df_properties.empty:
+                    extracted_frames.append((processed_filename, df_properties))
+                    processed_count += 1
+                else:
+                    app.logger.debug("No DataFrame or empty DataFrame for file ID: %s after processing.", processed_file_id)
+            except Exception as e:
+                current_app.logger.error(f"Error processing file in thread for data extraction: {e}", exc_info=True)
+
+        if not extracted_frames:
+            return jsonify({"message": "No data extracted. Selected files might be empty or failed processing.", "data": []}), 200
+
+        # 'Source Model' è una colonna a bassissima cardinalità (un valore per
+        # file): come Categorical con categorie condivise costa un int8/int16
+        # per riga invece di un oggetto str, e concat preserva il dtype senza
+        # upcast. assign() condivide i blocchi delle colonne non toccate.
+        source_categories = list(dict.fromkeys(name for name, _ in extracted_frames))
+        all_data_frames = [
+            df.assign(**{'Source Model': pd.Categorical([name] * len(df), categories=source_categories)})
+            for name, df in extracted_frames
+        ]
+
+        # copy=False evita la duplicazione di ogni blocco durante la concat.
+        df_combined = pd.concat(all_data_frames, ignore_index=True, copy=False)
+
+        # Content negotiation: clients that accept the Arrow stream format get
+        # zero-copy columnar bytes (no per-cell Python loop, ~2-5x faster to
+        # serialize and to parse in the browser with apache-arrow JS).
+        ARROW_MIME = 'application/vnd.apache.arrow.stream'
+        # Solo su richiesta esplicita del MIME Arrow nell'header Accept: un
+        # best_match su Accept: */* (il default di fetch() nel frontend)
+        # sceglierebbe Arrow e romperebbe i client JSON esistenti.
+        if ARROW_MIME in (request.headers.get('Accept') or ''):
+            # La conversione può fallire (ArrowInvalid) sulla colonna
+            # PropertyValue a tipi misti: in quel caso si prosegue sul ramo
+            # JSON invece di rispondere 500.
+            try:
+                sink = pa.BufferOutputStream()
+                batch = pa.RecordBatch.from_pandas(df_combined, preserve_index=False)
+                with pa.ipc.new_stream(sink, batch.schema) as writer:
+                    writer.write_batch(batch)
+                return Response(sink.getvalue().to_pybytes(), mimetype=ARROW_MIME), 200
+            except Exception as arrow_e:
+                app.logger.debug("Arrow stream conversion failed, serving JSON instead: %s", arrow_e)
+
+        # One vectorized NaN->None pass (C level), then orjson encodes the
+        # records without the per-cell Python dict comprehension jsonify needed.
+        df_clean = df_combined.astype(object).where(df_combined.notna(), None)
+        data_for_frontend = df_clean.to_dict(orient='records')
+
+        message = f"Data extracted from {processed_count} file(s). Total records: {len(data_for_frontend)}."
+        body = orjson.dumps({"message": message, "data": data_for_frontend},
+                            option=orjson.OPT_SERIALIZE_NUMPY)
+        return Response(body, mimetype='application/json'), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error during data extraction: {e}", exc_info=True)
+        return jsonify({"error": f"An unexpected error occurred during data extraction: {str(e)}"}), 500
+
+
+@app.route('/api/generate_chart', methods=['POST'])
+def generate_chart():
+    """Generates charts for selected processed IFC files."""
+    try:
+        data = request.get_json()
+        if not data or 'file_ids' not in data or not isinstance(data['file_ids'], list):
+            return jsonify({"error": "Missing or invalid 'file_ids' list in request body"}), 400
+
+        file_ids = data['file_ids']
+        if not file_ids:
+            return jsonify({"error": "'file_ids' list cannot be empty"}), 400
+
+        charts_data = []
+        processed_count = 0
+
+        futures = []
+        for file_id in file_ids:
+            status_info = parsing_status.get(file_id)
+            if status_info and status_info['status'] == 'completed':
+                file_info = uploaded_files_metadata.get(file_id)
+                if file_info is not None:
+                    futures.append(EXECUTOR.submit(process_single_ifc_file, file_id, file_info, app.config))
+                else:
+                    app.logger.warning("File ID %s not found in uploaded_files_metadata. Skipping for chart generation.", file_id)
+            else:
+                app.logger.warning("File ID %s not completed or not found in parsing_status. Skipping for chart generation.", file_id)
+
+        for future in futures:
+            try:
+                processed_file_id, processed_filename, df_properties = future.result()
+                if df_properties is not None and not df_properties.empty:
+                    # Generate chart for this specific file's data
+                    _, chart_image_base64 = data_visualizer.plot_entity_counts(df_properties.copy())
+                    if chart_image_base64:
+                        charts_data.append({
+                            "file_id": processed_file_id,
+                            "filename": processed_filename,
+                            "chart_base64": chart_image_base64
+                        })
+                        processed_count += 1
+                    else:
+                        app.logger.warning("Chart generation failed for %s.", processed_filename)
+                else:
+                    app.logger.debug("No DataFrame or empty DataFrame for file ID: %s. Cannot generate chart.", processed_file_id)
+            except Exception as e:
+                current_app.logger.error(f"Error processing file in thread for chart generation: {e}", exc_info=True)
+
+        if not charts_data:
+            return jsonify({"message": "No charts generated. Selected files might be empty or failed processing.", "charts": []}), 200
+        
+        message = f"{len(charts_data)} chart(s) generated successfully from {processed_count} file(s)."
+        return jsonify({"message": message, "charts": charts_data}), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error during chart generation: {e}", exc_info=True)
+        return jsonify({"error": f"An unexpected error occurred during chart generation: {str(e)}"}), 500
+
+
+@app.route('/api/generate_graph', methods=['POST'])
+def generate_graph():
+    """Generates a knowledge graph for a single processed IFC file."""
+    # Lazy imports: paid once per worker on the first graph request instead
+    # of at app startup (modules stay cached in sys.modules afterwards).
+    import networkx as nx
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    try:
+        data = request.get_json()
+        if not data or 'file_id' not in data or not isinstance(data['file_id'], str):
+            return jsonify({"error": "Missing or invalid 'file_id' (string) in request body"}), 400
+
+        file_id = data['file_id']
+        if not file_id:
+            return jsonify({"error": "'file_id' cannot be empty"}), 400
+
+        status_info = parsing_status.get(file_id)
+        file_info = uploaded_files_metadata.get(file_id)
+        if not (status_info and status_info['status'] == 'completed' and file_info is not None):
+            return jsonify({"error": f"File ID {file_id} not found, not processed, or metadata missing."}), 404
+        G = nx.DiGraph()
+        filename = file_info.get("original_filename", "Unknown File")
+
+        # Fast path for re-renders: the deduplicated edge list is persisted as
+        # an .npz next to the DataFrame cache after the first generation, so
+        # later calls rebuild G from two memory-mapped arrays and never touch
+        # the (much wider) property table at all.
+        edges_cache_path = file_info.get("edges_cache_path")
+        if edges_cache_path:
+            try:
+                arrays = np.load(edges_cache_path, mmap_mode='r')
+                src, dst = arrays['src'], arrays['dst']
+                G.add_nodes_from(np.unique(src), type='IfcEntity')
+                G.add_nodes_from(np.unique(dst), type='PropertySet')
+                G.add_edges_from(zip(src, dst))
+            except Exception as edges_load_e:
+                app.logger.warning("Could not load edge cache %s for %s: %s. Rebuilding from DataFrame.", edges_cache_path, file_id, edges_load_e)
+                G.clear()
+
+        if not G.nodes:
+            # The graph only needs two columns: project the cache read to them
+            # (both entity-column spellings are requested; the missing one is
+            # dropped against the cache schema) instead of loading the whole
+            # wide property table.
+            _, filename, df_properties = process_single_ifc_file(
+                file_id, file_info, app.config,
+                columns=['IFC_Entity', 'IfcEntity', 'PropertySet'])
+
+            if df_properties is None or df_properties.empty:
+                return jsonify({"error": f"No data available for file {filename} (ID: {file_id}) to generate graph."}), 400
+
+            # Simple graph: IfcEntity -> PropertySet (if both columns exist)
+            # The parser emits 'IFC_Entity'; accept the legacy 'IfcEntity' name too.
+            entity_col = 'IFC_Entity' if 'IFC_Entity' in df_properties.columns else 'IfcEntity'
+            if entity_col in df_properties.columns and 'PropertySet' in df_properties.columns:
+                # Vectorized edge extraction: one C-level dropna/dedup pass over the
+                # two columns instead of a Python frame per row (iterrows allocates
+                # a Series per iteration), then a single bulk add_edges_from call.
+                pairs = df_properties[[entity_col, 'PropertySet']].dropna().astype(str).drop_duplicates()
+                src = pairs[entity_col].to_numpy()
+                dst = pairs['PropertySet'].to_numpy()
+                G.add_nodes_from(pairs[entity_col].unique(), type='IfcEntity')
+                G.add_nodes_from(pairs['PropertySet'].unique(), type='PropertySet')
+                G.add_edges_from(zip(src, dst))
+                try:
+                    # Backfill for files parsed before edge caching existed.
+                    new_edges_path = _write_edges_cache(file_id, df_properties, app.config['CACHE_FOLDER'])
+                    if new_edges_path:
+                        file_info["edges_cache_path"] = new_edges_path
+                except Exception as edges_save_e:
+                    app.logger.warning("Could not persist edge cache for %s: %s", file_id, edges_save_e)
+        
+        if not G.nodes:
+            return jsonify({"message": f"No graph data (nodes/edges) could be generated for {filename}.", "graph_path": None}), 200
+
+        # OO API (Figure + Agg canvas) instead of pyplot: no global figure
+        # registry or state-machine lock, so concurrent graph requests render
+        # in parallel and nothing leaks if an exception fires mid-render.
+        fig = Figure(figsize=(12, 12))
+        try:
+            ax = fig.add_subplot(111)
+            try:
+                # C-backed Graphviz layout (sfdp) when pygraphviz is installed:
+                # orders of magnitude faster than spring_layout on non-tiny graphs.
+                pos = nx.nx_agraph.graphviz_layout(G, prog='sfdp')
+            except Exception:
+                pos = nx.spring_layout(G, k=0.15, iterations=20)
+            if G.number_of_nodes() > 2000:
+                # Large graph: labels/arrows would dominate render time and be
+                # unreadable anyway; draw plain nodes and edges only.
+                nx.draw_networkx_edges(G, pos, ax=ax, arrows=False)
+                nx.draw_networkx_nodes(G, pos, ax=ax, node_size=20, node_color="skyblue")
+            else:
+                nx.draw(G, pos, ax=ax, with_labels=True, node_size=500, node_color="skyblue", font_size=8, arrows=True)
+            ax.set_title(f"Knowledge Graph for {filename}")
+
+            graph_filename = f"graph_{file_id.replace('-', '_')}.png"
+            graph_file_path = os.path.join(GRAPHS_FOLDER, graph_filename)
+            # dpi=72 keeps the PNG small and rasterization cheap for web
+            # display; set on the figure because print_png takes no dpi kwarg.
+            fig.set_dpi(72)
+            FigureCanvasAgg(fig).print_png(graph_file_path)
+        finally:
+            fig.clear() # Release artists/buffers even on exceptions
+
+        # Construct URL for the frontend
+        # serve_generated_content serves from STATIC_FOLDER (backend/static)
+        # So, path should be relative to STATIC_FOLDER
+        relative_graph_path = os.path.join(GRAPHS_SUBDIR, graph_filename).replace('\\', '/')
+        graph_url = f"/generated_content/{relative_graph_path}"
+
+        return jsonify({"message": f"Graph generated successfully for {filename}.", "graph_path": graph_url}), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error during graph generation: {e}", exc_info=True)
+        return jsonify({"error": f"An unexpected error occurred during graph generation: {str(e)}"}), 500
+
+
+# --- Asynchronous Parsing Task --- 
+def parse_ifc_file_async(file_id, ifc_file_path, output_dir):
+    """
+    Parses an IFC file asynchronously, updates status, and saves results.
+    This function is run in a separate thread.
+    """
+    if not parsing_status.update_fields(file_id, status='processing'):
+        app.logger.warning("Error: file_id %s not found in parsing_status for async task.", file_id)
+        return
+    app.logger.debug("Async parsing started for file_id: %s, path: %s", file_id, ifc_file_path)
+
+    try:
+        # Call the parser function from ifc_parser module
+        # output_dir here is app.config['CACHE_FOLDER'] passed from the upload endpoint
+        csv_path, json_path = ifc_parser.parse_ifc_to_files(ifc_file_path, output_dir, file_id)
+
+        if csv_path and json_path:
+            parsing_status.update_fields(
+                file_id,
+                status='completed',
+                result={
+                    'csv_path': os.path.relpath(csv_path, os.path.dirname(__file__)), 
+                    'json_path': os.path.relpath(json_path, os.path.dirname(__file__)) 
+                },
+                error=None
+            )
+            app.logger.debug("Async parsing completed for file_id: %s. CSV: %s, JSON: %s", file_id, csv_path, json_path)
+        else:
+            parsing_status.update_fields(file_id, status='failed',
+                                         error='Parsing completed but no output files were generated.')
+            app.logger.warning("Async parsing failed for file_id: %s. No output files.", file_id)
+
+    except Exception as e:
+        parsing_status.update_fields(file_id, status='failed', error=str(e))
+        app.logger.warning("Exception during async parsing for file_id %s: %s", file_id, e)
+
+
+# --- Endpoint for Checking Parsing Status --- 
+
+# Coalescing single-flight dei poll di stato: con più tab che interrogano lo
+# stesso file ogni 500 ms, una sola lettura+serializzazione per finestra di
+# 200 ms serve tutti i chiamanti; gli altri ricevono i byte già pronti.
+_STATUS_CACHE_WINDOW = 0.2
+# Oltre questa soglia le voci scadute vengono sfoltite alla scrittura: senza
+# un tetto cache e lock crescerebbero di una voce per file_id per tutta la
+# vita del processo (una finestra di 200 ms rende morta ogni voce scaduta).
+_STATUS_CACHE_MAX = 1024
+_status_cache = {} # file_id -> (deadline monotonic, body bytes)
+_status_locks = {} # lock per-file_id: un solo "fetch" in volo per chiave
+_status_cache_lock = threading.Lock()
+
+
+def _status_lock_for(file_id):
+    with _status_cache_lock:
+        lock = _status_locks.get(file_id)
+        if lock is None:
+            lock = _status_locks.setdefault(file_id, threading.Lock())
+        return lock
+
+
+@app.route('/api/status/<file_id>', methods=['GET'])
+def get_parsing_status(file_id):
+    """
+    Endpoint to check the parsing status of a file.
+    """
+    now = time.monotonic()
+    with _status_cache_lock:
+        hit = _status_cache.get(file_id)
+    if hit is not None and hit[0] > now:
+        return Response(hit[1], mimetype='application/json'), 200
+
+    # Niente lock per id sconosciuti: _status_lock_for alloca una voce in
+    # _status_locks, e gli id che finiscono in 404 non passano mai dalla
+    # cache, quindi l'eviction non li raccoglierebbe mai.
+    if file_id not in parsing_status:
+        return jsonify({"error": "File ID not found"}), 404
+
+    with _status_lock_for(file_id):
+        # Ricontrolla sotto il lock: un altro chiamante potrebbe aver già
+        # pubblicato la risposta mentre aspettavamo.
+        now = time.monotonic()
+        with _status_cache_lock:
+            hit = _status_cache.get(file_id)
+        if hit is not None and hit[0] > now:
+            return Response(hit[1], mimetype='application/json'), 200
+
+        status_info = parsing_status.get(file_id)
+        if status_info is None:
+            return jsonify({"error": "File ID not found"}), 404
+        # Byte orjson pre-serializzati: i poll coalizzati non ripagano
+        # né la lettura dello store né l'encoding.
+        body = orjson.dumps(status_info)
+        with _status_cache_lock:
+            if len(_status_cache) >= _STATUS_CACHE_MAX:
+                # Sfoltisce le voci oltre deadline e i loro lock. Un lock
+                # rimosso mentre è tenuto da un altro thread al più fa
+                # partire un fetch doppio per quella chiave: innocuo.
+                for stale_id in [fid for fid, (deadline, _) in _status_cache.items()
+                                 if deadline <= now]:
+                    _status_cache.pop(stale_id, None)
+                    _status_locks.pop(stale_id, None)
+                # Lock orfani (chiave mai arrivata in cache o già sfoltita).
+                for stale_id in [fid for fid in _status_locks
+                                 if fid not in _status_cache and fid != file_id]:
+                    _status_locks.pop(stale_id, None)
+            _status_cache[file_id] = (now + _STATUS_CACHE_WINDOW, body)
+    return Response(body, mimetype='application/json'), 200
+
+@app.route('/hello')
+def hello():
+    return "Hello, World!"
+
+@app.route('/')
+def serve_index():
+    """Serves the main index.html file for the frontend."""
+    # os.path.dirname(__file__) is /backend
+    # os.path.join(os.path.dirname(__file__), '..', 'frontend') is /frontend
+    frontend_dir = os.path.join(os.path.dirname(__file__), '..', 'frontend')
+    return send_from_directory(frontend_dir, 'index.html')
+
+# Note: Flask is already configured to serve static files from '../frontend/static'
+# via the static_folder parameter in app = Flask(...).
+# So, requests to /static/css/style.css will correctly serve frontend/static/css/style.css.
+# No explicit @app.route('/static/...') for frontend static files is needed here.
+
+# --- Serve Backend Generated Static Files ---
+# This is for files generated by the backend, like plots or reports,
+# that might be stored in backend/static/
+# The existing STATIC_FOLDER variable (defined earlier in the script) points to backend/static/
+# Con IFC_X_ACCEL_REDIRECT=1 (dietro nginx) i file generati non passano più
+# byte per byte dallo stack WSGI: la risposta porta solo l'header
+# X-Accel-Redirect e nginx trasmette il file col sendfile(2) del kernel.
+# Configurazione nginx corrispondente:
+#   location /_protected/ { internal; alias <backend>/static/; sendfile on; tcp_nopush on; }
+USE_X_ACCEL_REDIRECT = os.environ.get('IFC_X_ACCEL_REDIRECT') == '1'
+
+@app.route('/generated_content/<path:filename>')
+def serve_generated_content(filename):
+    """Serves files from the backend's dedicated static content folder (backend/static)."""
+    if USE_X_ACCEL_REDIRECT:
+        mimetype, _ = mimetypes.guess_type(filename)
+        resp = Response(mimetype=mimetype or 'application/octet-stream')
+        resp.headers['X-Accel-Redirect'] = '/_protected/' + filename
+        return resp
+    # STATIC_FOLDER is defined above as os.path.join(os.path.dirname(__file__), 'static')
+    return send_from_directory(STATIC_FOLDER, filename)
+
+# --- Main Execution ---
+if __name__ == '__main__':
+    # Il server di sviluppo Werkzeug è mono-richiesta: in produzione usare
+    #   gunicorn -c gunicorn_conf.py app:app
+    # (worker gevent, vedi gunicorn_conf.py). Il run diretto resta
+    # disponibile per lo sviluppo locale dietro FLASK_DEV=1.
+    if os.environ.get('FLASK_DEV'):
+        # debug=True ricarica automaticamente il server quando modifichi il codice
+        # e fornisce messaggi di errore più dettagliati nel browser.
+        # Non usare debug=True in produzione!
+        app.run(debug=True, host='0.0.0.0', port=5000) # Ascolta su tutte le interfacce sulla porta 5000
+    else:
+        print("Refusing to start the Werkzeug dev server without FLASK_DEV=1.")
+        print("For production use: gunicorn -c gunicorn_conf.py app:app")
+
@@ -0,0 +1,108 @@
+# backend/embed_cache.py
+# Cache persistente su disco (SQLite) per gli embedding usati da AIValidator.
+#
+# Senza cache, ogni riavvio del processo ri-embedda lo stesso JSON canonico e
+# le API di embedding fatturano per token. Qui ogni vettore è indicizzato da
+# (provider, modello, hash del testo) e salvato come blob float16 (metà dei
+# byte su disco e in lettura rispetto a float32); le richieste mancanti sono
+# raggruppate in un'unica chiamata batch all'embedder.
+
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+
+DEFAULT_DB_FILENAME = "embeddings.db"
+
+
+class EmbedCache:
+    """Cache key->vettore con write-back batched su SQLite (WAL)."""
+
+    def __init__(self, db_path, provider, model, embed_fn):
+        """
+        Args:
+            db_path (str): Percorso del database SQLite (creato se assente).
+            provider (str): Identificativo del provider di embedding.
+            model (str): Nome del modello di embedding.
+            embed_fn (callable): Funzione batch list[str] -> list[vettore].
+        """
+        self.provider = provider
+        self.model = model
+        self.embed_fn = embed_fn
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL + synchronous=NORMAL: scritture non bloccano le letture e niente
+        # fsync per ogni insert (accettabile per una cache ricostruibile).
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB)"
+        )
+        self._conn.commit()
+
+    def _key(self, text):
+        """Chiave stabile (provider, modello, sha256 del testo)."""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.provider}:{self.model}:{digest}"
+
+    def get_or_embed(self, texts):
+        """
+        Restituisce gli embedding dei testi, nell'ordine di input.
+
+        I testi già in cache vengono letti da disco; i mancanti sono embeddati
+        con UNA sola chiamata batch a embed_fn e scritti con executemany.
+
+        Args:
+            texts (list[str]): Testi da embeddare.
+        Returns:
+            list[np.ndarray]: Un vettore float32 per testo.
+        """
+        keys = [self._key(t) for t in texts]
+        vectors = [None] * len(texts)
+
+        placeholders = ",".join("?" * len(keys))
+        rows = self._conn.execute(
+            f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})", keys
+        ).fetchall()
+        by_key = {key: blob for key, blob in rows}
+        for i, key in enumerate(keys):
+            blob = by_key.get(key)
+            if blob is not None:
+                vectors[i] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+
+        miss_indices = [i for i, v in enumerate(vectors) if v is None]
+        if miss_indices:
+            embedded = self.embed_fn([texts[i] for i in miss_indices])
+            new_rows = []
+            for i, vec in zip(miss_indices, embedded):
+                vec32 = np.asarray(vec, dtype=np.float32)
+                vectors[i] = vec32
+                new_rows.append(
+                    (keys[i], np.asarray(vec32, dtype=np.float16).tobytes())
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", new_rows
+            )
+            self._conn.commit()
+
+        return vectors
+
+    def close(self):
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    # Piccolo test manuale con un embedder fittizio deterministico.
+    def fake_embed(texts):
+        return [np.full(8, float(len(t)), dtype=np.float32) for t in texts]
+
+    cache = EmbedCache("temp_embed_cache.db", "local", "fake", fake_embed)
+    first = cache.get_or_embed(["IfcWall", "IfcDoor"])
+    second = cache.get_or_embed(["IfcWall", "IfcSlab"])
+    print(f"First call vectors: {[v[:2] for v in first]}")
+    print(f"Second call vectors (IfcWall from cache): {[v[:2] for v in second]}")
+    cache.close()
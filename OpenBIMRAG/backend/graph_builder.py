@@ -1,186 +1,385 @@
-# backend/graph_builder.py
-# Modulo per costruire un grafo di conoscenza da un file IFC usando networkx.
-
-import ifcopenshell
-import networkx as nx
-import time # Per misurare il tempo di costruzione
-
-def build_graph_from_ifc(ifc_file_path):
-    """
-    Costruisce un grafo NetworkX (orientato) da un file IFC.
-
-    In questa versione:
-    - Nodi: Entità IfcProduct (elementi, spazi, ecc.), identificati dal loro GlobalId.
-            Attributi del nodo includono: ifc_type, name (se presente), ifc_id (ID numerico).
-    - Archi: Rappresentano relazioni IFC:
-        - IfcRelContainedInSpatialStructure: Elemento -> contenuto_in -> Struttura Spaziale
-        - IfcRelAggregates: Parte -> aggregato_a -> Intero
-        - IfcRelConnects: Elemento1 -> connesso_a -> Elemento2 (bidirezionale se non specificato)
-        - IfcRelVoidsElement: Apertura (es. IfcOpeningElement) -> svuota -> Elemento (es. IfcWall)
-        - IfcRelFillsElement: Elemento (es. IfcDoor, IfcWindow) -> riempie -> Apertura (IfcOpeningElement)
-
-    Args:
-        ifc_file_path (str): Il percorso del file IFC.
-
-    Returns:
-        networkx.DiGraph: Il grafo costruito, oppure None se il file non può essere aperto.
-        float: Tempo impiegato per costruire il grafo in secondi.
-    """
-    start_time = time.time()
-    try:
-        ifc_model = ifcopenshell.open(ifc_file_path)
-        print(f"Successfully opened IFC file for graph building: {ifc_file_path}")
-    except Exception as e:
-        print(f"Error opening IFC file '{ifc_file_path}' for graph building: {e}")
-        return None, 0.0
-
-    G = nx.DiGraph() # Grafo Orientato
-    
-    # --- 1. Aggiungere Nodi ---
-    # Usiamo IfcObjectDefinition come base più generale che include IfcProduct, IfcActor, IfcGroup, ecc.
-    # IfcProduct è comunque una scelta comune per gli elementi principali.
-    # Per ora, ci concentriamo su IfcProduct per coerenza con l'esempio precedente.
-    definitions = ifc_model.by_type("IfcProduct") 
-    print(f"Found {len(definitions)} IfcProduct instances to process as potential nodes.")
-
-    for item in definitions:
-        try:
-            global_id = item.GlobalId
-            if not global_id: # Alcune entità potrebbero non avere un GlobalId
-                print(f"Warning: Skipping entity ID {item.id()} of type {item.is_a()} due to missing GlobalId.")
-                continue
-            
-            node_id = global_id # Usiamo GlobalId come ID univoco del nodo
-            
-            G.add_node(
-                node_id, 
-                ifc_type=item.is_a(), 
-                name=getattr(item, 'Name', None),
-                description=getattr(item, 'Description', None),
-                ifc_id=item.id() 
-            )
-        except AttributeError as e:
-            print(f"Warning: Skipping entity ID {item.id()} of type {item.is_a()} due to attribute error: {e}")
-            continue
-            
-    print(f"Added {G.number_of_nodes()} nodes to the graph.")
-
-    # --- 2. Aggiungere Archi (Relazioni) ---
-    
-    # Funzione helper per aggiungere archi verificando l'esistenza dei nodi
-    def add_relationship_edge(source_entity, target_entity, rel_instance, default_label="related_to"):
-        try:
-            if not (hasattr(source_entity, 'GlobalId') and hasattr(target_entity, 'GlobalId')):
-                return False # Salta se manca GlobalId
-                
-            source_id = source_entity.GlobalId
-            target_id = target_entity.GlobalId
-
-            if G.has_node(source_id) and G.has_node(target_id):
-                G.add_edge(
-                    source_id, 
-                    target_id, 
-                    relation_type=rel_instance.is_a(), 
-                    relation_name=getattr(rel_instance, 'Name', default_label),
-                    ifc_rel_id=rel_instance.id()
-                )
-                return True
-            # else:
-                # print(f"Warning: Nodes for relation ID {rel_instance.id()} not found in graph. Source: {source_id}, Target: {target_id}")
-        except AttributeError as e:
-            print(f"Warning: Skipping relation ID {rel_instance.id()} of type {rel_instance.is_a()} due to missing attribute: {e}")
-        return False
-
-    edges_added_count = 0
-
-    # IfcRelContainedInSpatialStructure: Elemento -> contenuto_in -> Struttura Spaziale
-    for rel in ifc_model.by_type("IfcRelContainedInSpatialStructure"):
-        relating_structure = rel.RelatingStructure
-        for element in rel.RelatedElements:
-            if add_relationship_edge(element, relating_structure, rel, "is_contained_in"):
-                edges_added_count +=1
-    
-    # IfcRelAggregates: Parte -> aggregato_a -> Intero
-    for rel in ifc_model.by_type("IfcRelAggregates"):
-        relating_object = rel.RelatingObject # L'intero
-        for part in rel.RelatedObjects: # Le parti
-            if add_relationship_edge(part, relating_object, rel, "is_part_of"):
-                edges_added_count += 1
-
-    # IfcRelConnects (generico, potrebbe necessitare di specializzazione per tipo di connessione)
-    # La direzione qui può essere meno definita, potremmo renderlo non orientato o aggiungere due archi.
-    # Per ora, creiamo un arco da RelatingElement a RelatedElement.
-    for rel in ifc_model.by_type("IfcRelConnects"):
-        # Questa relazione è più complessa, es. IfcRelConnectsElements, IfcRelConnectsPorts, etc.
-        # Consideriamo IfcRelConnectsElements per connessioni tra elementi strutturali/architettonici
-        if hasattr(rel, 'RelatingElement') and hasattr(rel, 'RelatedElement'):
-            if add_relationship_edge(rel.RelatingElement, rel.RelatedElement, rel, "connects_to"):
-                 edges_added_count += 1
-            # Potremmo voler aggiungere anche l'arco inverso per alcune connessioni
-            # if add_relationship_edge(rel.RelatedElement, rel.RelatingElement, rel, "connected_by"):
-            # edges_added_count += 1
-
-
-    # IfcRelVoidsElement: Apertura (IfcOpeningElement) -> svuota -> Elemento (es. IfcWall)
-    for rel in ifc_model.by_type("IfcRelVoidsElement"):
-        opening = rel.RelatedOpeningElement # L'apertura
-        element_voided = rel.RelatingBuildingElement # L'elemento che viene svuotato
-        if add_relationship_edge(opening, element_voided, rel, "voids_in_element"):
-            edges_added_count += 1
-
-    # IfcRelFillsElement: Elemento (es. IfcDoor, IfcWindow) -> riempie -> Apertura (IfcOpeningElement)
-    for rel in ifc_model.by_type("IfcRelFillsElement"):
-        filling_element = rel.RelatedBuildingElement # L'elemento che riempie (porta/finestra)
-        opening_filled = rel.RelatingOpeningElement # L'apertura che viene riempita
-        if add_relationship_edge(filling_element, opening_filled, rel, "fills_opening"):
-            edges_added_count += 1
-            
-    # TODO: Considerare altre relazioni come:
-    # - IfcRelDefinesByProperties (collegare i PropertySet come nodi, o aggiungere proprietà come attributi degli archi/nodi)
-    # - IfcRelAssignsToGroup
-    # - IfcRelSpaceBoundary
-
-    end_time = time.time()
-    build_duration = end_time - start_time
-    print(f"Added {edges_added_count} relationship edges.")
-    print(f"Graph built in {build_duration:.2f} seconds. Total nodes: {G.number_of_nodes()}, Total edges: {G.number_of_edges()}")
-
-    return G, build_duration
-
-# --- Esempio di utilizzo (per testare il modulo se eseguito direttamente) ---
-if __name__ == "__main__":
-    # Sostituire 'None' con un percorso valido a un file .ifc per testare
-    test_ifc_file = None 
-    
-    if test_ifc_file:
-        print(f"Building graph for: {test_ifc_file}...")
-        graph, duration = build_graph_from_ifc(test_ifc_file)
-        
-        if graph:
-            print(f"\n--- Graph Info ---")
-            print(f"Graph built successfully in {duration:.2f} seconds.")
-            print(f"Number of nodes: {graph.number_of_nodes()}")
-            print(f"Number of edges: {graph.number_of_edges()}")
-
-            if graph.number_of_nodes() > 0:
-                print("\n--- Sample Nodes (first 5) ---")
-                node_count = 0
-                for node_id, data in graph.nodes(data=True):
-                    print(f"Node: {node_id}, Type: {data.get('ifc_type')}, Name: {data.get('name')}")
-                    node_count += 1
-                    if node_count >= 5:
-                        break
-            
-            if graph.number_of_edges() > 0:
-                print("\n--- Sample Edges (first 5) ---")
-                edge_count = 0
-                for u, v, data in graph.edges(data=True):
-                    print(f"Edge: ({u}) --[{data.get('relation_name', data.get('relation_type'))}]--> ({v})")
-                    edge_count += 1
-                    if edge_count >= 5:
-                        break
-        else:
-            print("\nFailed to build graph.")
-    else:
-        print("Test IFC file path not specified. Modify 'test_ifc_file' in the code to run tests.")
-
+# backend/graph_builder.py
+# Modulo per costruire un grafo di conoscenza da un file IFC usando networkx.
+
+from collections import OrderedDict, defaultdict
+import hashlib
+import logging
+import os
+import pickle
+import threading
+
+import ifcopenshell
+import networkx as nx
+import time # Per misurare il tempo di costruzione
+
+# Logger di modulo: i messaggi per-relazione saltata sono a livello DEBUG,
+# quindi sul percorso caldo non pagano né formattazione né syscall di stdio
+# quando il livello non è abilitato (il vecchio print scriveva sempre).
+# La configurazione degli handler (es. QueueHandler per spostare l'I/O fuori
+# dal thread worker) è lasciata all'applicazione.
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# zstandard è opzionale: senza, la cache dei grafi resta pickle non compresso.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Cache content-addressed dei grafi costruiti: la chiave è l'hash dei byte del
+# file IFC, quindi ri-upload dello stesso modello saltano completamente la
+# ricostruzione (che è il costo dominante della funzione).
+GRAPH_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache', 'graphs')
+
+# L1 in-process (LRU, poche voci: i DiGraph sono grandi) davanti alla cache su
+# disco: un hit evita anche unpickle + decompressione. I grafi restituiti da
+# questo livello sono condivisi tra i chiamanti: trattarli come read-only.
+_GRAPH_L1_MAX = 4
+_graph_l1 = OrderedDict()
+_graph_l1_lock = threading.Lock()
+
+
+def _graph_l1_get(digest):
+    with _graph_l1_lock:
+        G = _graph_l1.get(digest)
+        if G is not None:
+            _graph_l1.move_to_end(digest)
+        return G
+
+
+def _graph_l1_put(digest, G):
+    with _graph_l1_lock:
+        _graph_l1[digest] = G
+        _graph_l1.move_to_end(digest)
+        while len(_graph_l1) > _GRAPH_L1_MAX:
+            _graph_l1.popitem(last=False)
+
+
+def _hash_ifc_file(path):
+    """Digest blake2b del contenuto, letto a blocchi da 1 MiB (niente RAM spike)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _graph_cache_path(digest):
+    ext = '.gpickle.zst' if zstandard is not None else '.gpickle'
+    return os.path.join(GRAPH_CACHE_DIR, digest + ext)
+
+
+def _load_cached_graph(cache_path):
+    """Grafo dalla cache, o None se assente/corrotto."""
+    try:
+        with open(cache_path, 'rb') as f:
+            blob = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        if cache_path.endswith('.zst'):
+            blob = zstandard.ZstdDecompressor().decompress(blob)
+        return pickle.loads(blob)
+    except Exception as e:
+        log.warning("Could not load cached graph %s: %s", cache_path, e)
+        return None
+
+
+def _store_cached_graph(cache_path, G):
+    try:
+        blob = pickle.dumps(G, protocol=5)
+        if cache_path.endswith('.zst'):
+            blob = zstandard.ZstdCompressor(level=3).compress(blob)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            f.write(blob)
+    except Exception as e:
+        log.warning("Could not persist graph cache %s: %s", cache_path, e)
+
+# Memo per-schema della gerarchia dei tipi: (schema, tipo concreto, base) ->
+# bool. L'espansione dei sottotipi che by_type rifarebbe a ogni chiamata si
+# paga così una sola volta per tipo per schema in tutta la vita del processo
+# (i modelli successivi con lo stesso schema fanno solo lookup su dict).
+_is_subtype_cache = {}
+
+
+def _is_subtype(schema_name, type_name, base_type, sample_entity):
+    key = (schema_name, type_name, base_type)
+    hit = _is_subtype_cache.get(key)
+    if hit is None:
+        hit = sample_entity.is_a(base_type)
+        _is_subtype_cache[key] = hit
+    return hit
+
+
+def _collect_relation_edges(entities_of, node_ids):
+    """
+    Emette la lista di tuple (src, dst, attrs) per le relazioni supportate,
+    più il conteggio degli archi accodati.
+
+    Tenuta separata dalla costruzione del grafo e ridotta a pure tuple e
+    variabili locali (append/__contains__ già risolti fuori dal loop): è la
+    parte dominata dall'overhead dell'interprete e la forma si presta a una
+    sostituzione 1:1 con un'estensione compilata (Cython) quando il progetto
+    avrà una toolchain di build — che oggi nel repo non esiste.
+
+    Args:
+        entities_of (callable): str -> lista di istanze del tipo (o sottotipi).
+        node_ids (set): GlobalId dei nodi già inseriti nel grafo.
+    Returns:
+        tuple[list, int]: (lista archi per add_edges_from, archi accodati).
+    """
+    edges = []
+    edges_append = edges.append
+    has_node = node_ids.__contains__
+
+    # Funzione helper per accodare archi verificando l'esistenza dei nodi
+    def add_relationship_edge(source_entity, target_entity, rel_type, rel_name, rel_id):
+        try:
+            source_id = getattr(source_entity, 'GlobalId', None)
+            target_id = getattr(target_entity, 'GlobalId', None)
+            if not (source_id and target_id):
+                return False # Salta se manca GlobalId
+
+            if has_node(source_id) and has_node(target_id):
+                edges_append((source_id, target_id, {
+                    'relation_type': rel_type,
+                    'relation_name': rel_name,
+                    'ifc_rel_id': rel_id,
+                }))
+                return True
+            # else:
+                # log.debug("Nodes for relation ID %s not found in graph. Source: %s, Target: %s", rel_id, source_id, target_id)
+        except AttributeError as e:
+            log.debug("Skipping relation ID %s of type %s due to missing attribute: %s", rel_id, rel_type, e)
+        return False
+
+    edges_added_count = 0
+
+    # IfcRelContainedInSpatialStructure: Elemento -> contenuto_in -> Struttura Spaziale
+    for rel in entities_of("IfcRelContainedInSpatialStructure"):
+        rel_type, rel_id = rel.is_a(), rel.id()
+        rel_name = getattr(rel, 'Name', "is_contained_in")
+        relating_structure = rel.RelatingStructure
+        for element in rel.RelatedElements:
+            if add_relationship_edge(element, relating_structure, rel_type, rel_name, rel_id):
+                edges_added_count +=1
+
+    # IfcRelAggregates: Parte -> aggregato_a -> Intero
+    for rel in entities_of("IfcRelAggregates"):
+        rel_type, rel_id = rel.is_a(), rel.id()
+        rel_name = getattr(rel, 'Name', "is_part_of")
+        relating_object = rel.RelatingObject # L'intero
+        for part in rel.RelatedObjects: # Le parti
+            if add_relationship_edge(part, relating_object, rel_type, rel_name, rel_id):
+                edges_added_count += 1
+
+    # IfcRelConnects (generico, potrebbe necessitare di specializzazione per tipo di connessione)
+    # La direzione qui può essere meno definita, potremmo renderlo non orientato o aggiungere due archi.
+    # Per ora, creiamo un arco da RelatingElement a RelatedElement.
+    for rel in entities_of("IfcRelConnects"):
+        # Questa relazione è più complessa, es. IfcRelConnectsElements, IfcRelConnectsPorts, etc.
+        # Consideriamo IfcRelConnectsElements per connessioni tra elementi strutturali/architettonici
+        if hasattr(rel, 'RelatingElement') and hasattr(rel, 'RelatedElement'):
+            rel_type, rel_id = rel.is_a(), rel.id()
+            rel_name = getattr(rel, 'Name', "connects_to")
+            if add_relationship_edge(rel.RelatingElement, rel.RelatedElement, rel_type, rel_name, rel_id):
+                 edges_added_count += 1
+            # Potremmo voler aggiungere anche l'arco inverso per alcune connessioni
+            # if add_relationship_edge(rel.RelatedElement, rel.RelatingElement, rel_type, "connected_by", rel_id):
+            # edges_added_count += 1
+
+    # IfcRelVoidsElement: Apertura (IfcOpeningElement) -> svuota -> Elemento (es. IfcWall)
+    for rel in entities_of("IfcRelVoidsElement"):
+        rel_type, rel_id = rel.is_a(), rel.id()
+        rel_name = getattr(rel, 'Name', "voids_in_element")
+        opening = rel.RelatedOpeningElement # L'apertura
+        element_voided = rel.RelatingBuildingElement # L'elemento che viene svuotato
+        if add_relationship_edge(opening, element_voided, rel_type, rel_name, rel_id):
+            edges_added_count += 1
+
+    # IfcRelFillsElement: Elemento (es. IfcDoor, IfcWindow) -> riempie -> Apertura (IfcOpeningElement)
+    for rel in entities_of("IfcRelFillsElement"):
+        rel_type, rel_id = rel.is_a(), rel.id()
+        rel_name = getattr(rel, 'Name', "fills_opening")
+        filling_element = rel.RelatedBuildingElement # L'elemento che riempie (porta/finestra)
+        opening_filled = rel.RelatingOpeningElement # L'apertura che viene riempita
+        if add_relationship_edge(filling_element, opening_filled, rel_type, rel_name, rel_id):
+            edges_added_count += 1
+
+    # TODO: Considerare altre relazioni come:
+    # - IfcRelDefinesByProperties (collegare i PropertySet come nodi, o aggiungere proprietà come attributi degli archi/nodi)
+    # - IfcRelAssignsToGroup
+    # - IfcRelSpaceBoundary
+
+    return edges, edges_added_count
+
+
+def build_graph_from_ifc(ifc_file):
+    """
+    Costruisce un grafo NetworkX (orientato) da un file IFC.
+
+    In questa versione:
+    - Nodi: Entità IfcProduct (elementi, spazi, ecc.), identificati dal loro GlobalId.
+            Attributi del nodo includono: ifc_type, name (se presente), ifc_id (ID numerico).
+    - Archi: Rappresentano relazioni IFC:
+        - IfcRelContainedInSpatialStructure: Elemento -> contenuto_in -> Struttura Spaziale
+        - IfcRelAggregates: Parte -> aggregato_a -> Intero
+        - IfcRelConnects: Elemento1 -> connesso_a -> Elemento2 (bidirezionale se non specificato)
+        - IfcRelVoidsElement: Apertura (es. IfcOpeningElement) -> svuota -> Elemento (es. IfcWall)
+        - IfcRelFillsElement: Elemento (es. IfcDoor, IfcWindow) -> riempie -> Apertura (IfcOpeningElement)
+
+    Args:
+        ifc_file (str | ifcopenshell.file): Percorso del file IFC, oppure un
+            modello già aperto con ifcopenshell.open. Passare il modello
+            permette di condividere UNA sola open() tra parser e graph
+            builder nello stesso task di upload (il file STEP viene
+            attraversato una volta invece di due).
+
+    Returns:
+        networkx.DiGraph: Il grafo costruito, oppure None se il file non può essere aperto.
+        float: Tempo impiegato per costruire il grafo in secondi.
+    """
+    start_time = time.time()
+
+    digest = None
+    cache_path = None
+    if isinstance(ifc_file, str):
+        # Hit di cache: stesso contenuto => stesso grafo. L1 in memoria prima
+        # (microsecondi), poi il pickle su disco (millisecondi), poi il rebuild.
+        try:
+            digest = _hash_ifc_file(ifc_file)
+            cache_path = _graph_cache_path(digest)
+        except OSError as e:
+            log.warning("Could not hash IFC file '%s': %s", ifc_file, e)
+        if digest:
+            cached_graph = _graph_l1_get(digest)
+            if cached_graph is not None:
+                return cached_graph, time.time() - start_time
+        if cache_path:
+            cached_graph = _load_cached_graph(cache_path)
+            if cached_graph is not None:
+                log.debug("Loaded graph from content-addressed cache: %s", cache_path)
+                _graph_l1_put(digest, cached_graph)
+                return cached_graph, time.time() - start_time
+
+        try:
+            ifc_model = ifcopenshell.open(ifc_file)
+            log.debug("Successfully opened IFC file for graph building: %s", ifc_file)
+        except Exception as e:
+            log.error("Error opening IFC file '%s' for graph building: %s", ifc_file, e)
+            return None, 0.0
+    else:
+        # Modello già aperto a monte: nessuna seconda ifcopenshell.open e
+        # nessuna seconda passata sul file STEP. La cache content-addressed
+        # si applica solo quando conosciamo il percorso su disco.
+        ifc_model = ifc_file
+
+    G = nx.DiGraph() # Grafo Orientato
+    
+    # --- 1. Aggiungere Nodi ---
+    # Usiamo IfcObjectDefinition come base più generale che include IfcProduct, IfcActor, IfcGroup, ecc.
+    # IfcProduct è comunque una scelta comune per gli elementi principali.
+    # Per ora, ci concentriamo su IfcProduct per coerenza con l'esempio precedente.
+    # Un'unica passata sul modello che smista le entità in bucket per tipo:
+    # ogni by_type() ri-attraversa l'indice interno di ifcopenshell, e qui ne
+    # servirebbero sei. Le interrogazioni successive (prodotti e relazioni)
+    # diventano lookup su dict, con un solo is_a(base) per tipo DISTINTO per
+    # risolvere i sottotipi (poche centinaia di check invece di uno a entità).
+    buckets = defaultdict(list)
+    for ent in ifc_model:
+        buckets[ent.is_a()].append(ent)
+
+    schema_name = getattr(ifc_model, 'schema', 'UNKNOWN')
+
+    def entities_of(base_type):
+        """Istanze il cui tipo è base_type o un suo sottotipo (memo per schema)."""
+        out = []
+        for type_name, ents in buckets.items():
+            if ents and _is_subtype(schema_name, type_name, base_type, ents[0]):
+                out.extend(ents)
+        return out
+
+    definitions = entities_of("IfcProduct")
+    log.debug("Found %d IfcProduct instances to process as potential nodes.", len(definitions))
+
+    # Accumula i nodi in una lista e inseriscili con UNA chiamata bulk:
+    # add_node per-elemento paga allocazioni dict e ridimensionamenti di _adj
+    # a ogni chiamata, add_nodes_from li ammortizza su tutto il batch.
+    nodes = []
+    for item in definitions:
+        try:
+            global_id = item.GlobalId
+            if not global_id: # Alcune entità potrebbero non avere un GlobalId
+                log.debug("Skipping entity ID %s of type %s due to missing GlobalId.", item.id(), item.is_a())
+                continue
+            
+            # Usiamo GlobalId come ID univoco del nodo
+            nodes.append((global_id, {
+                'ifc_type': item.is_a(),
+                'name': getattr(item, 'Name', None),
+                'description': getattr(item, 'Description', None),
+                'ifc_id': item.id(),
+            }))
+        except AttributeError as e:
+            log.debug("Skipping entity ID %s of type %s due to attribute error: %s", item.id(), item.is_a(), e)
+            continue
+
+    G.add_nodes_from(nodes)
+
+    # --- 2. Aggiungere Archi (Relazioni) ---
+
+    edges, edges_added_count = _collect_relation_edges(entities_of, {gid for gid, _ in nodes})
+    G.add_edges_from(edges)
+
+    end_time = time.time()
+    build_duration = end_time - start_time
+    # Un solo riepilogo aggregato a INFO al posto dei print incrementali.
+    log.info("Graph built in %.2fs: %d nodes, %d edges (%d relationship edges queued).",
+             build_duration, G.number_of_nodes(), G.number_of_edges(), edges_added_count)
+
+    if cache_path:
+        _store_cached_graph(cache_path, G)
+    if digest:
+        _graph_l1_put(digest, G)
+
+    return G, build_duration
+
+# --- Esempio di utilizzo (per testare il modulo se eseguito direttamente) ---
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Sostituire 'None' con un percorso valido a un file .ifc per testare
+    test_ifc_file = None 
+    
+    if test_ifc_file:
+        print(f"Building graph for: {test_ifc_file}...")
+        graph, duration = build_graph_from_ifc(test_ifc_file)
+        
+        if graph:
+            print(f"\n--- Graph Info ---")
+            print(f"Graph built successfully in {duration:.2f} seconds.")
+            print(f"Number of nodes: {graph.number_of_nodes()}")
+            print(f"Number of edges: {graph.number_of_edges()}")
+
+            if graph.number_of_nodes() > 0:
+                print("\n--- Sample Nodes (first 5) ---")
+                node_count = 0
+                for node_id, data in graph.nodes(data=True):
+                    print(f"Node: {node_id}, Type: {data.get('ifc_type')}, Name: {data.get('name')}")
+                    node_count += 1
+                    if node_count >= 5:
+                        break
+            
+            if graph.number_of_edges() > 0:
+                print("\n--- Sample Edges (first 5) ---")
+                edge_count = 0
+                for u, v, data in graph.edges(data=True):
+                    print(f"Edge: ({u}) --[{data.get('relation_name', data.get('relation_type'))}]--> ({v})")
+                    edge_count += 1
+                    if edge_count >= 5:
+                        break
+        else:
+            print("\nFailed to build graph.")
+    else:
+        print("Test IFC file path not specified. Modify 'test_ifc_file' in the code to run tests.")
+
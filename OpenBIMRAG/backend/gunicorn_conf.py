@@ -0,0 +1,36 @@
+# backend/gunicorn_conf.py
+# Configurazione gunicorn per servire l'app in produzione:
+#   gunicorn -c gunicorn_conf.py app:app
+#
+# Il server di sviluppo Werkzeug (app.run) serializza le richieste: anche un
+# semplice poll su /api/status/<file_id> resta in coda dietro qualunque altra
+# richiesta. Con worker gevent i poll di stato e il serving dei file generati
+# (I/O-bound) si sovrappongono dentro ogni worker.
+#
+# NOTA: con più di un worker lo stato di parsing deve stare in Redis
+# (impostare IFC_REDIS_URL, vedi app.py), altrimenti ogni processo vede solo
+# i propri upload.
+
+import multiprocessing
+import os
+
+bind = os.environ.get('IFC_BIND', '0.0.0.0:5000')
+
+# Regola classica per carichi misti CPU/I-O.
+workers = 2 * multiprocessing.cpu_count() + 1
+worker_class = 'gevent'
+worker_connections = 1000
+
+# I worker importano l'app dopo il fork: niente stato matplotlib/pandas
+# condiviso in copy-on-write tra processi.
+preload_app = False
+
+
+def post_fork(server, worker):
+    # Pre-warm della cache dei font di matplotlib nel worker appena nato,
+    # così la prima richiesta di grafico non paga la scansione dei font.
+    try:
+        import data_visualizer
+        data_visualizer.warm_font_cache()
+    except Exception:
+        pass
@@ -1,23 +1,107 @@
 # backend/ifc_parser.py
 # Module for parsing IFC files, extracting metadata (including software with a simplified method) and properties.
 
+import concurrent.futures # For parallel parsing of many files
+import functools # lru_cache for re-opened IFC models
 import ifcopenshell
 import pandas as pd
 import os
 import json # Added for JSON operations
 
+# pyarrow's CSV writer streams from Arrow columnar buffers on multiple
+# threads; optional so the module keeps working without it installed.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as papq
+except ImportError:
+    pa = None
+    pacsv = None
+    papq = None
+
+# orjson serializes in Rust with SIMD string escaping, several times faster
+# than stdlib json on large record lists; optional, stdlib as fallback.
+try:
+    import orjson
+
+    def _dump_json_record(obj):
+        # Compact form for the streamed per-record JSON writes.
+        return orjson.dumps(obj)
+except ImportError:
+    orjson = None
+
+    def _dump_json_record(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def _extract_nominal_simple(nominal_value):
+    """wrappedValue is already the final Python scalar for these types."""
+    return nominal_value.wrappedValue
+
+
+def _extract_nominal_generic(nominal_value):
+    """Fallback for rarer value types: unwrap up to twice, tolerating absence."""
+    prop_value = getattr(nominal_value, "wrappedValue", None)
+    # If wrappedValue is another IFC entity (e.g., IfcLabel), extract its value
+    if hasattr(prop_value, "wrappedValue"):
+        prop_value = getattr(prop_value, "wrappedValue", prop_value)
+    return prop_value
+
+
+# Dispatch on the declared value type instead of probing every value with
+# hasattr: for the common simple types a single wrappedValue read suffices.
+# Keyed on is_a() rather than type(nv).__name__ because ifcopenshell wraps
+# every select value in the same entity_instance Python class.
+_NOMINAL_EXTRACTORS = {
+    name: _extract_nominal_simple
+    for name in ("IfcLabel", "IfcText", "IfcIdentifier", "IfcInteger",
+                 "IfcReal", "IfcBoolean", "IfcLogical")
+}
+
+
+# Output writes go through a small shared thread pool so the CSV and JSON of
+# the same file hit the disk concurrently (file I/O releases the GIL) instead
+# of back to back; in batch runs the writes also overlap the next file's
+# CPU-bound parse.
+_IO_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+
+@functools.lru_cache(maxsize=4)
+def _open_ifc_model(ifc_file_path, _mtime):
+    # _mtime is only part of the cache key: a rewritten file (new mtime)
+    # misses the cache and is re-parsed.
+    return ifcopenshell.open(ifc_file_path)
+
+
+def _open_ifc_cached(ifc_file_path):
+    """
+    Opens an IFC file, reusing an already-parsed model when the same path
+    is requested again with an unchanged mtime. Metadata extraction,
+    property extraction and graph building all open the same upload;
+    without this each step re-parses the file from scratch.
+    """
+    return _open_ifc_model(ifc_file_path, os.path.getmtime(ifc_file_path))
+
+
+def _as_ifc_model(ifc_file):
+    """Accepts an IFC file path or an already-opened ifcopenshell model."""
+    if isinstance(ifc_file, str):
+        return _open_ifc_cached(ifc_file)
+    return ifc_file
+
+
 def extract_ifc_metadata(ifc_file_path):
     """
     Opens an IFC file and extracts key metadata: file name, schema, software (simplified method).
 
     Args:
-        ifc_file_path (str): The path to the IFC file.
+        ifc_file_path (str or ifcopenshell.file): The path to the IFC file,
+            or an already-opened model (skips the open/cache step).
 
     Returns:
         tuple: (file_name, ifc_schema, authoring_software) or (None, None, None) in case of error.
     """
     try:
-        ifc_model = ifcopenshell.open(ifc_file_path)
+        ifc_model = _as_ifc_model(ifc_file_path)
     except Exception as e:
         # Use English for error/log messages that might end up in server logs
         print(f"Error opening IFC file '{ifc_file_path}' for metadata extraction: {e}")
@@ -52,14 +136,15 @@ def extract_properties_from_ifc(ifc_file_path):
     The DataFrame will include a 'FileName' column derived from the IFC header.
 
     Args:
-        ifc_file_path (str): The path to the IFC file to process.
+        ifc_file_path (str or ifcopenshell.file): The path to the IFC file to
+            process, or an already-opened model (skips the open/cache step).
 
     Returns:
         pandas.DataFrame: A DataFrame containing the extracted data including 'FileName'.
                           Returns an empty DataFrame if the file cannot be opened or no data is found.
     """
     try:
-        ifc_model = ifcopenshell.open(ifc_file_path)
+        ifc_model = _as_ifc_model(ifc_file_path)
     except Exception as e:
         # Use English for error/log messages
         print(f"Error opening IFC file '{ifc_file_path}' for property extraction: {e}")
@@ -73,62 +158,158 @@ def extract_properties_from_ifc(ifc_file_path):
         print(f"Warning: Could not extract file_name from header for {ifc_file_path}: {e_header}")
         # Continue even if header filename extraction fails, properties might still be extractable.
 
-    extracted_data_list = []
-    instances = ifc_model.by_type("IfcElement") # Extracts from all IfcElement
-
-    for inst in instances:
-        entity_type = inst.is_a()
-        instance_name = inst.Name if hasattr(inst, 'Name') else None
-        global_id = inst.GlobalId if hasattr(inst, 'GlobalId') else None
-
-        if hasattr(inst, "IsDefinedBy"):
-            for rel in inst.IsDefinedBy:
-                if rel.is_a("IfcRelDefinesByProperties"):
-                    prop_definition = rel.RelatingPropertyDefinition
-                    if prop_definition.is_a("IfcPropertySet"):
-                        pset_name = prop_definition.Name if hasattr(prop_definition, 'Name') else "Unknown"
-                        
-                        if hasattr(prop_definition, "HasProperties"):
-                            for prop in prop_definition.HasProperties:
-                                prop_name = prop.Name if hasattr(prop, 'Name') else "Unknown"
-                                prop_value = None
-                                
-                                if hasattr(prop, "NominalValue") and prop.NominalValue is not None:
-                                    prop_value = getattr(prop.NominalValue, "wrappedValue", None)
-                                    # If wrappedValue is another IFC entity (e.g., IfcLabel), extract its value
-                                    if hasattr(prop_value, "wrappedValue"):
-                                         prop_value = getattr(prop_value, "wrappedValue", prop_value)
-
-                                extracted_data_list.append({
-                                    "IFC_Entity": entity_type,
-                                    "IFC_Name": instance_name,
-                                    "IFC_GlobalId": global_id,
-                                    "PropertySet": pset_name,
-                                    "PropertyName": prop_name,
-                                    "PropertyValue": prop_value
-                                })
-    
-    df = pd.DataFrame(extracted_data_list)
+    # Columnar (structure-of-arrays) accumulation: one Python list per output
+    # column instead of one dict per row. Appending 6 scalars is far cheaper
+    # than allocating and hashing a 6-key dict per property, and pandas builds
+    # the DataFrame directly from the column lists without re-pivoting a
+    # list of records.
+    #
+    # The lists are pre-sized from the IfcPropertySingleValue count, which
+    # approximates the row count: filling preallocated slots avoids the
+    # geometric list-grow reallocations (a couple dozen progressively larger
+    # pointer copies on million-row models). Property sets shared by several
+    # elements fan out to more rows than the estimate, so the cursor falls
+    # back to plain append once the slots run out.
+    estimated_rows = len(ifc_model.by_type("IfcPropertySingleValue"))
+    col_entities = [None] * estimated_rows
+    col_names = [None] * estimated_rows
+    col_gids = [None] * estimated_rows
+    col_psets = [None] * estimated_rows
+    col_pnames = [None] * estimated_rows
+    col_pvalues = [None] * estimated_rows
+    row_cursor = 0
+
+    # Relationship-centric walk: iterate IfcRelDefinesByProperties directly
+    # (O(#rels)) instead of IfcElement x IsDefinedBy. The old loop resolved
+    # the IsDefinedBy inverse attribute per element and re-read each shared
+    # property set once per element it was attached to; here every property
+    # set is read once per relationship and fanned out to its RelatedObjects.
+    element_info = {} # id -> (entity_type, name, global_id), cached per element
+
+    # Every attribute access (.Name, .NominalValue, ...) crosses into
+    # ifcopenshell's wrapper and builds a fresh Python object, which is what
+    # dominates extraction time. A shared IfcPropertySet can be referenced by
+    # many relationships (some exporters emit one IfcRelDefinesByProperties
+    # per element), so the decoded (pset_name, rows) are cached per definition
+    # id and each property is crossed exactly once per distinct set.
+    pset_cache = {} # id -> (pset_name, [(prop_name, prop_value), ...])
+
+    for rel in ifc_model.by_type("IfcRelDefinesByProperties"):
+        prop_definition = rel.RelatingPropertyDefinition
+        cached_pset = pset_cache.get(prop_definition.id())
+        if cached_pset is None:
+            if not prop_definition.is_a("IfcPropertySet"):
+                # Negative entry: skip the is_a probe on the next reference.
+                pset_cache[prop_definition.id()] = ("", [])
+                continue
+            pset_name = getattr(prop_definition, 'Name', "Unknown")
+
+            # Single getattr with default instead of hasattr + attribute
+            # access: each hasattr call goes through the same __getattr__
+            # machinery as the read itself, so guarded ternaries would pay
+            # that cost twice.
+            prop_rows = []
+            for prop in getattr(prop_definition, "HasProperties", ()):
+                # Fast path for the dominant property type: on an
+                # IfcPropertySingleValue the schema guarantees Name (slot 0)
+                # and NominalValue (slot 2), so positional access into the
+                # entity skips the by-name attribute lookups. Rarer types
+                # (enumerated/list/bounded values) keep the guarded reads.
+                if prop.is_a() == "IfcPropertySingleValue":
+                    prop_name = prop[0]
+                    nominal_value = prop[2]
+                else:
+                    prop_name = getattr(prop, 'Name', "Unknown")
+                    nominal_value = getattr(prop, "NominalValue", None)
+
+                prop_value = None
+                if nominal_value is not None:
+                    extractor = _NOMINAL_EXTRACTORS.get(
+                        nominal_value.is_a(), _extract_nominal_generic)
+                    prop_value = extractor(nominal_value)
+
+                prop_rows.append((prop_name, prop_value))
+
+            pset_cache[prop_definition.id()] = (pset_name, prop_rows)
+        else:
+            pset_name, prop_rows = cached_pset
+
+        if not prop_rows:
+            continue
+
+        for inst in rel.RelatedObjects:
+            if not inst.is_a("IfcElement"): # Keep the original IfcElement-only scope
+                continue
+            info = element_info.get(inst.id())
+            if info is None:
+                info = (inst.is_a(), getattr(inst, 'Name', None), getattr(inst, 'GlobalId', None))
+                element_info[inst.id()] = info
+            entity_type, instance_name, global_id = info
+
+            for prop_name, prop_value in prop_rows:
+                if row_cursor < estimated_rows:
+                    col_entities[row_cursor] = entity_type
+                    col_names[row_cursor] = instance_name
+                    col_gids[row_cursor] = global_id
+                    col_psets[row_cursor] = pset_name
+                    col_pnames[row_cursor] = prop_name
+                    col_pvalues[row_cursor] = prop_value
+                else:
+                    col_entities.append(entity_type)
+                    col_names.append(instance_name)
+                    col_gids.append(global_id)
+                    col_psets.append(pset_name)
+                    col_pnames.append(prop_name)
+                    col_pvalues.append(prop_value)
+                row_cursor += 1
+
+    # Trim unused preallocated slots (properties without a related IfcElement
+    # keep the real row count below the estimate).
+    if row_cursor < estimated_rows:
+        col_entities = col_entities[:row_cursor]
+        col_names = col_names[:row_cursor]
+        col_gids = col_gids[:row_cursor]
+        col_psets = col_psets[:row_cursor]
+        col_pnames = col_pnames[:row_cursor]
+        col_pvalues = col_pvalues[:row_cursor]
+
+    # Columns are declared in their final order, with the scalar FileName
+    # broadcast by pandas across all rows: no df.insert + reorder-indexing
+    # afterwards, each of which rebuilt the block manager with a copy.
+    df = pd.DataFrame({
+        "FileName": file_name_header,
+        "IFC_Entity": col_entities,
+        "IFC_Name": col_names,
+        "IFC_GlobalId": col_gids,
+        "PropertySet": col_psets,
+        "PropertyName": col_pnames,
+        "PropertyValue": col_pvalues,
+    })
 
     if not df.empty:
-        # Add the file name from header to all rows of the DataFrame
-        df.insert(0, "FileName", file_name_header) 
-        # Reorder columns for consistency
-        df = df[
-            ["FileName", "IFC_Entity", "IFC_Name", "IFC_GlobalId",
-             "PropertySet", "PropertyName", "PropertyValue"]
-        ]
-    
+        # The entity/pset/property-name columns repeat a handful of distinct
+        # strings over many rows: category dtype stores each distinct string
+        # once plus small integer codes, cutting memory several-fold and
+        # speeding up the groupby/value_counts done downstream.
+        for cat_col in ("IFC_Entity", "PropertySet", "PropertyName"):
+            df[cat_col] = df[cat_col].astype("category")
+
     return df
 
-def parse_ifc_to_files(ifc_file_path, output_dir, file_id):
+def parse_ifc_to_files(ifc_file_path, output_dir, file_id, emit_parquet=True):
     """
     Parses an IFC file, extracts properties, and saves them to CSV and JSON files.
 
+    When pyarrow is available and emit_parquet is True, a {file_id}.parquet
+    file is also written (zstd + dictionary encoding): the repetitive
+    entity/pset columns collapse to roughly a byte per row and downstream
+    loaders can pd.read_parquet it instead of re-parsing the CSV.
+
     Args:
         ifc_file_path (str): Path to the IFC file.
         output_dir (str): Directory to save the output CSV and JSON files.
         file_id (str): A unique identifier for the file, used for naming output files.
+        emit_parquet (bool): Also write a Parquet artifact (default True).
 
     Returns:
         tuple: (csv_file_path, json_file_path) or (None, None) if parsing fails or no data.
@@ -140,14 +321,14 @@ def parse_ifc_to_files(ifc_file_path, output_dir, file_id):
         print(f"No properties extracted from {ifc_file_path}. Output files will not be generated for file_id: {file_id}.")
         return None, None
 
-    # Ensure output directory exists
-    if not os.path.exists(output_dir):
-        try:
-            os.makedirs(output_dir)
-            print(f"Created output directory: {output_dir}")
-        except Exception as e_mkdir:
-            print(f"Error creating output directory {output_dir}: {e_mkdir}. Cannot save files for file_id: {file_id}.")
-            return None, None
+    # Ensure output directory exists. exist_ok avoids the extra stat of an
+    # os.path.exists pre-check (and its TOCTOU race) when the directory is
+    # already there, which is every call after the first.
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except Exception as e_mkdir:
+        print(f"Error creating output directory {output_dir}: {e_mkdir}. Cannot save files for file_id: {file_id}.")
+        return None, None
 
     # Use file_id for unique, clean filenames (without original extension)
     base_filename = file_id 
@@ -156,49 +337,138 @@ def parse_ifc_to_files(ifc_file_path, output_dir, file_id):
 
     csv_file_path = os.path.join(output_dir, csv_filename)
     json_file_path = os.path.join(output_dir, json_filename)
+    parquet_file_path = os.path.join(output_dir, f"{base_filename}.parquet")
 
     try:
-        # Save to CSV
-        df_properties.to_csv(csv_file_path, index=False, encoding='utf-8')
-        print(f"Successfully saved CSV to {csv_file_path}")
-
-        # Save to JSON (structured semantic data - for now, records from DataFrame)
-        json_data_records = df_properties.to_dict(orient='records')
-        # Replace pd.NA or NaN with None for JSON compatibility
-        json_data_cleaned = []
-        for record in json_data_records:
-            cleaned_record = {}
-            for k, v in record.items():
-                if pd.isna(v):
-                    cleaned_record[k] = None
-                else:
-                    cleaned_record[k] = v
-            json_data_cleaned.append(cleaned_record)
-        
-        with open(json_file_path, 'w', encoding='utf-8') as f_json:
-            json.dump(json_data_cleaned, f_json, indent=4, ensure_ascii=False)
-        print(f"Successfully saved JSON to {json_file_path}")
-        
+        # Convert to Arrow once and let both writers read from the same
+        # contiguous columnar buffers, instead of each output traversing the
+        # pandas block manager on its own. PropertyValue typically mixes
+        # bool/str/int/float (the unwrapped IfcBoolean/IfcLabel/IfcReal
+        # values) and pyarrow raises ArrowInvalid on mixed object columns, so
+        # on failure retry with that column coerced to strings - the CSV
+        # stringifies values anyway; the JSON writer falls back to pandas to
+        # keep native types (see _write_json).
+        arrow_table = None
+        arrow_values_coerced = False
+        if pa is not None:
+            try:
+                arrow_table = pa.Table.from_pandas(df_properties, preserve_index=False)
+            except Exception:
+                coerced = df_properties.assign(
+                    PropertyValue=df_properties["PropertyValue"].map(
+                        lambda v: None if pd.isna(v) else str(v)))
+                arrow_table = pa.Table.from_pandas(coerced, preserve_index=False)
+                arrow_values_coerced = True
+
+        def _write_csv():
+            # Save to CSV: via pyarrow when available (multithreaded writer,
+            # several times faster than to_csv on wide string data).
+            if arrow_table is not None:
+                pacsv.write_csv(arrow_table, csv_file_path)
+            else:
+                df_properties.to_csv(csv_file_path, index=False, encoding='utf-8')
+            print(f"Successfully saved CSV to {csv_file_path}")
+
+        def _write_json():
+            # Save to JSON (structured semantic data). Records are streamed
+            # straight from the column arrays: one transient dict per row is
+            # serialized (orjson when available, see _dump_json_record) and
+            # written, instead of materializing the whole
+            # to_dict(orient='records') list of dicts up front.
+            if arrow_table is not None and not arrow_values_coerced:
+                # to_pydict decodes each Arrow column in one pass, with None
+                # already in place for nulls.
+                arrow_columns = arrow_table.to_pydict()
+                column_names = tuple(arrow_columns)
+                column_values = list(arrow_columns.values())
+            else:
+                # pandas fallback: missing values become None column-wise
+                # (orjson refuses NaN).
+                column_values = [
+                    df_properties[name].astype(object)
+                    .where(df_properties[name].notna(), None)
+                    .tolist()
+                    for name in df_properties.columns
+                ]
+                column_names = tuple(df_properties.columns)
+            with open(json_file_path, 'wb') as f_json:
+                f_json.write(b'[')
+                separator = b''
+                for row in zip(*column_values):
+                    f_json.write(separator)
+                    f_json.write(_dump_json_record(dict(zip(column_names, row))))
+                    separator = b',\n'
+                f_json.write(b']')
+            print(f"Successfully saved JSON to {json_file_path}")
+
+        def _write_parquet():
+            # Parquet as the primary columnar artifact: zstd plus dictionary
+            # encoding of the repetitive string columns makes it far smaller
+            # than the CSV and milliseconds to re-read.
+            papq.write_table(arrow_table, parquet_file_path,
+                             compression='zstd', use_dictionary=True)
+            print(f"Successfully saved Parquet to {parquet_file_path}")
+
+        # The writes run concurrently on the I/O pool. All are joined before
+        # returning so callers keep seeing the files fully written;
+        # exceptions re-raise here and land in the cleanup handler below.
+        write_futures = [_IO_POOL.submit(_write_csv), _IO_POOL.submit(_write_json)]
+        if emit_parquet and arrow_table is not None:
+            write_futures.append(_IO_POOL.submit(_write_parquet))
+        for write_future in write_futures:
+            write_future.result()
+
         return csv_file_path, json_file_path
 
     except Exception as e_save:
         print(f"Error saving output files for file_id {file_id} (IFC: {ifc_file_path}): {e_save}")
         # Clean up partially created files if an error occurs during saving
-        if os.path.exists(csv_file_path):
-            try:
-                os.remove(csv_file_path)
-                print(f"Cleaned up partial CSV: {csv_file_path}")
-            except Exception as e_del_csv:
-                print(f"Error deleting partial CSV {csv_file_path}: {e_del_csv}")
-        if os.path.exists(json_file_path):
-            try:
-                os.remove(json_file_path)
-                print(f"Cleaned up partial JSON: {json_file_path}")
-            except Exception as e_del_json:
-                print(f"Error deleting partial JSON {json_file_path}: {e_del_json}")
+        for partial_path in (csv_file_path, json_file_path, parquet_file_path):
+            if os.path.exists(partial_path):
+                try:
+                    os.remove(partial_path)
+                    print(f"Cleaned up partial output: {partial_path}")
+                except Exception as e_del:
+                    print(f"Error deleting partial output {partial_path}: {e_del}")
         return None, None
 
 
+def parse_many_ifc_to_files(paths_and_ids, output_dir, max_workers=None):
+    """
+    Parses several IFC files in parallel, one process per file.
+
+    IfcOpenShell's parse loop is CPU-bound pure Python, so threads would
+    serialize on the GIL; separate processes scale with the core count.
+
+    Args:
+        paths_and_ids (iterable): Pairs (ifc_file_path, file_id).
+        output_dir (str): Directory to save the output CSV and JSON files.
+        max_workers (int, optional): Worker process count. Defaults to os.cpu_count().
+
+    Returns:
+        dict: file_id -> (csv_file_path, json_file_path), with (None, None)
+              for files that failed to parse or produced no data.
+    """
+    results = {}
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        future_to_id = {
+            pool.submit(parse_ifc_to_files, ifc_file_path, output_dir, file_id): file_id
+            for ifc_file_path, file_id in paths_and_ids
+        }
+        for future in concurrent.futures.as_completed(future_to_id):
+            file_id = future_to_id[future]
+            try:
+                results[file_id] = future.result()
+            except Exception as e_worker:
+                print(f"Error parsing file_id {file_id} in worker process: {e_worker}")
+                results[file_id] = (None, None)
+
+    return results
+
+
 # --- Example of usage (for testing the module if executed directly) ---
 if __name__ == "__main__":
     # Replace 'None' with a valid path to an .ifc file to test
@@ -3,6 +3,15 @@
 
 import pandas as pd
 
+# pyarrow è opzionale: se presente, la scrittura CSV usa il writer
+# multithread di Arrow invece di DataFrame.to_csv.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+    pacsv = None
+
 # Esempio di funzione (da implementare)
 def generate_csv_report(data_df, output_path):
     """
@@ -14,7 +23,12 @@ def generate_csv_report(data_df, output_path):
         bool: True se il report è stato generato con successo, False altrimenti.
     """
     try:
-        data_df.to_csv(output_path, index=False)
+        if pacsv is not None:
+            pacsv.write_csv(
+                pa.Table.from_pandas(data_df, preserve_index=False),
+                output_path)
+        else:
+            data_df.to_csv(output_path, index=False)
         print(f"Report CSV generato con successo: {output_path}")
         return True
     except Exception as e: